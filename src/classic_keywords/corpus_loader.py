@@ -0,0 +1,91 @@
+from typing import Iterator, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from src.config import MIN_WORD_COUNT
+from src.config import MAX_AVG_WORD_LEN
+from src.config import LOAD_BATCH_SIZE
+
+
+def valid_abstract_mask(texts: Union[pa.Array, pa.ChunkedArray]) -> pa.BooleanArray:
+    """
+    Векторный аналог is_valid_abstract для Arrow-колонки строк:
+    не меньше MIN_WORD_COUNT слов и средняя длина слова не больше
+    MAX_AVG_WORD_LEN. Пустые значения и null отбрасываются.
+
+    utf8_split_whitespace делит по тем же пробельным символам, что и
+    str.split(); пустые строки по краям дают ведущие/хвостовые пробелы.
+    """
+    if isinstance(texts, pa.ChunkedArray):
+        texts = texts.combine_chunks()
+    words = pc.utf8_split_whitespace(texts)
+    word_lengths = pc.utf8_length(pc.list_flatten(words)).to_numpy(zero_copy_only=False)
+    row_of_word = pc.list_parent_indices(words).to_numpy(zero_copy_only=False)
+
+    word_count = np.bincount(row_of_word, weights=word_lengths > 0, minlength=len(texts))
+    chars_in_words = np.bincount(row_of_word, weights=word_lengths, minlength=len(texts))
+    avg_word_length = chars_in_words / np.maximum(word_count, 1)
+
+    mask = (word_count >= MIN_WORD_COUNT) & (chars_in_words > 0) & (avg_word_length <= MAX_AVG_WORD_LEN)
+    return pc.and_(pa.array(mask), pc.is_valid(texts))
+
+
+def _first_occurrences(texts: pa.Array, seen_hashes: set) -> np.ndarray:
+    """
+    Маска первых вхождений текстов с учетом уже прочитанных батчей.
+    Хеши считаются векторно (pandas hash_array), в seen_hashes
+    добавляются хеши оставленных текстов.
+    """
+    hashes = pd.util.hash_array(texts.to_numpy(zero_copy_only=False))
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[np.unique(hashes, return_index=True)[1]] = True
+    keep &= np.fromiter((text_hash not in seen_hashes for text_hash in hashes.tolist()),
+                        dtype=bool, count=len(hashes))
+    seen_hashes.update(hashes[keep].tolist())
+    return keep
+
+
+def iter_clean_batches(path: str, columns: Optional[Sequence[str]] = None,
+                       text_column: str = "abstract",
+                       batch_size: int = LOAD_BATCH_SIZE,
+                       drop_duplicates: bool = True) -> Iterator[pa.RecordBatch]:
+    """
+    Потоково читает parquet по record batch и отдает очищенные батчи.
+
+    Читаются только нужные колонки (columns плюс text_column), фильтры
+    считаются ядрами pyarrow.compute без цикла по строкам. При
+    drop_duplicates повторы text_column отбрасываются (первое вхождение
+    остается); между батчами хранится только 64-битный хеш каждого
+    уникального текста, а сами тексты в памяти не накапливаются.
+    """
+    if columns is not None and text_column not in columns:
+        columns = [text_column, *columns]
+    parquet_file = pq.ParquetFile(path)
+    seen_hashes = set()
+
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        mask = valid_abstract_mask(batch.column(text_column))
+        batch = batch.filter(mask)
+        if drop_duplicates and batch.num_rows:
+            batch = batch.filter(_first_occurrences(batch.column(text_column), seen_hashes))
+        if batch.num_rows:
+            yield batch
+
+
+def load_clean_corpus(path: str, columns: Optional[Sequence[str]] = None,
+                      text_column: str = "abstract",
+                      batch_size: int = LOAD_BATCH_SIZE,
+                      drop_duplicates: bool = True) -> pd.DataFrame:
+    """Собирает очищенные батчи iter_clean_batches в один DataFrame."""
+    batches = list(iter_clean_batches(path, columns, text_column, batch_size, drop_duplicates))
+    if not batches:
+        schema = pq.read_schema(path)
+        if columns is not None:
+            schema = pa.schema([schema.field(name) for name in dict.fromkeys([text_column, *columns])])
+        return schema.empty_table().to_pandas()
+    table = pa.Table.from_batches(batches)
+    print(f"Загружено {table.num_rows} очищенных аннотаций из {path}")
+    return table.to_pandas()
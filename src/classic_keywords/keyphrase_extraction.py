@@ -1,25 +1,85 @@
-import yake
-from typing import List
+import os
+from collections import deque
+from typing import Iterable, Iterator, List, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
 from src.config import YAKE_LANGUAGE, YAKE_MAX_NGRAM_SIZE, YAKE_NUM_KEYWORDS
+from src.config import YAKE_CHUNK_SIZE
+from src.chunking import iter_chunks
 
-kw_extractor = yake.KeywordExtractor(
-    lan=YAKE_LANGUAGE,
-    n=YAKE_MAX_NGRAM_SIZE,
-    dedupLim=0.9,
-    top=YAKE_NUM_KEYWORDS,
-    features=None
-)
+def _create_extractor():
+    """Создает YAKE-экстрактор с параметрами из конфига."""
+    import yake
+    return yake.KeywordExtractor(
+        lan=YAKE_LANGUAGE,
+        n=YAKE_MAX_NGRAM_SIZE,
+        dedupLim=0.9,
+        top=YAKE_NUM_KEYWORDS,
+        features=None
+    )
 
-def extract_yake_keyphrases(text: str) -> List[str]:
+kw_extractor = None
+
+def get_extractor():
+    """Возвращает YAKE-экстрактор процесса, создавая его при первом вызове."""
+    global kw_extractor
+    if kw_extractor is None:
+        kw_extractor = _create_extractor()
+    return kw_extractor
+
+def extract_yake_keyphrases(text: str, return_scores: bool = False) -> Union[List[str], List[Tuple[str, float]]]:
     """
     Извлекает ключевые фразы из текста с помощью YAKE.
-    Возвращает список ключевых фраз (только строки).
+    Возвращает список ключевых фраз (только строки) или пары
+    (фраза, скор) при return_scores=True; у YAKE меньший скор лучше.
     """
     if not isinstance(text, str) or not text.strip():
         return []
     
-    keywords_with_scores = kw_extractor.extract_keywords(text)
+    keywords_with_scores = get_extractor().extract_keywords(text)
+    
+    if return_scores:
+        return [(kw, float(score)) for kw, score in keywords_with_scores]
     
     keywords = [kw for kw, score in keywords_with_scores]
     
-    return keywords
\ No newline at end of file
+    return keywords
+
+def _init_yake_worker():
+    """
+    Сбрасывает унаследованный от родителя экстрактор: воркер создаст
+    собственный через get_extractor() при первом тексте.
+    """
+    global kw_extractor
+    kw_extractor = None
+
+def _extract_chunk(texts: List[str], return_scores: bool) -> List[list]:
+    """Извлекает ключевые фразы для чанка текстов внутри воркера."""
+    return [extract_yake_keyphrases(text, return_scores) for text in texts]
+
+def extract_yake_keyphrases_batch(texts: Iterable[str], n_jobs: int = -1,
+                                  chunksize: int = YAKE_CHUNK_SIZE,
+                                  return_scores: bool = False) -> Iterator[list]:
+    """
+    Потоково извлекает ключевые фразы YAKE для корпуса в пуле процессов.
+    Результаты возвращаются лениво и в исходном порядке, по одному
+    списку на текст; одновременно в работе находится не больше
+    2 * n_jobs чанков.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    chunks = iter_chunks(texts, chunksize)
+
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk, return_scores)
+        return
+
+    max_pending = 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_yake_worker) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_extract_chunk, chunk, return_scores))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
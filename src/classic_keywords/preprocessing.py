@@ -1,20 +1,35 @@
+import os
 import re
-import nltk
+from collections import deque
 from functools import lru_cache
-from nltk.corpus import stopwords
-from pymorphy3 import MorphAnalyzer
+from typing import FrozenSet, Iterable, Iterator, List
+from concurrent.futures import ProcessPoolExecutor
 from src.config import MIN_WORD_COUNT
 from src.config import MAX_AVG_WORD_LEN
+from src.config import PREPROCESS_CHUNK_SIZE
+from src.chunking import iter_chunks
 
-try:
-    russian_stopwords = stopwords.words("russian")
-except LookupError:
-    nltk.download('stopwords', quiet=True)
-    russian_stopwords = stopwords.words("russian")
-
-morph = MorphAnalyzer()
+NON_WORD_RE = re.compile(r'[^а-яa-z0-9\-]')
 
+@lru_cache(maxsize=None)
+def get_russian_stopwords() -> FrozenSet[str]:
+    """
+    Загружает русские стоп-слова NLTK при первом обращении
+    (nltk импортируется дольше секунды и может скачивать корпус).
+    """
+    import nltk
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words("russian"))
+    except LookupError:
+        nltk.download('stopwords', quiet=True)
+        return frozenset(stopwords.words("russian"))
 
+@lru_cache(maxsize=None)
+def get_morph():
+    """Создает MorphAnalyzer при первом обращении (загрузка словарей занимает время)."""
+    from pymorphy3 import MorphAnalyzer
+    return MorphAnalyzer()
 
 def is_valid_abstract(text: str) -> bool:
     """
@@ -37,7 +52,7 @@ def is_valid_abstract(text: str) -> bool:
 @lru_cache(maxsize=100_000)
 def lemmatize_word(token: str) -> str:
     """Лемматизирует одно слово с кешированием."""
-    return morph.parse(token)[0].normal_form
+    return get_morph().parse(token)[0].normal_form
 
 def preprocess_text(text: str) -> str:
     """
@@ -46,11 +61,48 @@ def preprocess_text(text: str) -> str:
     if not isinstance(text, str):
         return ""
     text = text.lower()
-    text = re.sub(r'[^а-яa-z0-9\-]', ' ', text)
+    text = NON_WORD_RE.sub(' ', text)
     tokens = text.split()
     lemmatized_tokens = [lemmatize_word(token) for token in tokens]
+    russian_stopwords = get_russian_stopwords()
     cleaned_tokens = [
         token for token in lemmatized_tokens
         if token not in russian_stopwords and len(token) > 2
     ]
-    return " ".join(cleaned_tokens)
\ No newline at end of file
+    return " ".join(cleaned_tokens)
+
+def _init_preprocess_worker():
+    """Сбрасывает MorphAnalyzer и кеш лемм: воркер создаст собственные при первом тексте."""
+    get_morph.cache_clear()
+    lemmatize_word.cache_clear()
+
+def _preprocess_chunk(texts: List[str]) -> List[str]:
+    """Предобрабатывает чанк текстов внутри воркера."""
+    return [preprocess_text(text) for text in texts]
+
+def preprocess_corpus(texts: Iterable[str], n_jobs: int = -1,
+                      chunk_size: int = PREPROCESS_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Потоково предобрабатывает корпус для TF-IDF в пуле процессов.
+    Результаты возвращаются лениво и в исходном порядке; одновременно
+    в работе находится не больше 2 * n_jobs чанков, поэтому корпус
+    может не помещаться в память целиком.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    chunks = iter_chunks(texts, chunk_size)
+
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield from _preprocess_chunk(chunk)
+        return
+
+    max_pending = 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_preprocess_worker) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_preprocess_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
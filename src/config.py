@@ -1,18 +1,134 @@
+import os
+
+# Каталог с данными; по умолчанию ../data относительно notebooks/
+DATA_DIR = os.environ.get("DATA_DIR", "../data")
+
 # Параметры очистки данных
 MIN_WORD_COUNT = 25
 MAX_AVG_WORD_LEN = 15
+PREPROCESS_CHUNK_SIZE = 1000
+# Размер record batch при потоковом чтении parquet
+LOAD_BATCH_SIZE = 10_000
 
 # Параметры для YAKE
 YAKE_LANGUAGE = "ru"
 YAKE_MAX_NGRAM_SIZE = 3
 YAKE_NUM_KEYWORDS = 7
+YAKE_CHUNK_SIZE = 200
 
 # Параметры для TF-IDF
 TFIDF_NGRAM_RANGE = (1, 3)
 TOP_N_SEARCH = 5
 
+# Параметры гибридного поиска (TF-IDF + эмбеддинги)
+# Способ слияния: "rrf" (reciprocal rank fusion) или "blend" (смешивание нормированных скоров)
+HYBRID_FUSION = "rrf"
+HYBRID_RRF_K = 60
+HYBRID_ALPHA = 0.5  # вес семантического поиска при "blend"
+HYBRID_CANDIDATE_MULTIPLIER = 4
+# Если лучший TF-IDF скор не ниже порога, эмбеддинги не считаются (None — отключено)
+HYBRID_SHORT_CIRCUIT_SCORE = None
+
 # DEFAULT_MODEL_NAME = "google/embeddinggemma-300m"
 DEFAULT_MODEL_NAME = "ai-forever/FRIDA"
-DEFAULT_EMBEDDING_PATH = "../data/embeddings.npy"
-DEFAULT_FAISS_INDEX_PATH = "../data/faiss_index.bin"
-DEFAULT_BATCH_SIZE = 64
\ No newline at end of file
+DEFAULT_EMBEDDING_PATH = os.path.join(DATA_DIR, "embeddings.npy")
+DEFAULT_FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index.bin")
+# Директория append-only шардов кеша эмбеддингов документов
+DEFAULT_EMBEDDING_CACHE_PATH = os.path.join(DATA_DIR, "embedding_cache")
+DEFAULT_BATCH_SIZE = 64
+
+# Параметры кодировщика на CPU
+# Бэкенд: "torch" (fp32), "torch_int8" (динамическая int8-квантизация Linear-слоев)
+# или "onnx" (ONNX Runtime, нужен пакет optimum[onnxruntime])
+ENCODER_BACKEND = "torch"
+ENCODER_ONNX_FILE_NAME = None  # например "onnx/model_qint8_avx512_vnni.onnx"; None — model.onnx
+ENCODER_NUM_THREADS = None  # intra-op потоки; None — по умолчанию библиотеки
+ENCODER_MAX_SEQ_LENGTH = 512
+
+# Параметры бенчмарка поиска
+BENCHMARK_CORPUS_SIZES = (10_000, 100_000, 1_000_000)
+BENCHMARK_BATCH_SIZES = (1, 8, 32, 128)
+BENCHMARK_WORK_DIR = os.path.join(DATA_DIR, "benchmark")
+BENCHMARK_OUTPUT_PATH = os.path.join(DATA_DIR, "benchmark", "report.json")
+# Качество на размеченных запросах по типам индекса и хранения эмбеддингов
+# (python -m src.metrics.storage_quality); storage_dtype влияет на результат
+# только через переранжирование, поэтому оно включено
+STORAGE_QUALITY_CONFIGS = (
+    ("flat", "float32"), ("flat", "float16"),
+    ("sq8", "float32"), ("sq8", "float16"),
+    ("sq_fp16", "float32"), ("sq_fp16", "float16"),
+)
+STORAGE_QUALITY_RERANK_CANDIDATES = 50
+STORAGE_QUALITY_OUTPUT_PATH = os.path.join(DATA_DIR, "benchmark", "storage_quality.json")
+
+# Бюджет времени импорта точек входа, секунды (python -m src.metrics.startup)
+STARTUP_IMPORT_BUDGETS = {
+    "src.classic_keywords.preprocessing": 0.3,
+    "src.classic_keywords.keyphrase_extraction": 0.3,
+    "src.search_tf_idf.search": 1.0,
+    "src.search_embeddings.engine": 1.0,
+    "src.search_hybrid.engine": 1.0,
+    "src.search_service.server": 1.0,
+}
+
+# Инструментирование: границы гистограмм времени этапов (секунды), порт
+# HTTP-экспорта метрик Prometheus для процессов без своего сервера
+# (None — не запускать) и файл стеков семплирующего профайлера (None — выключен)
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None
+PROFILER_OUTPUT = os.environ.get("PROFILER_OUTPUT")
+PROFILER_INTERVAL = 0.01
+
+# Параметры HTTP-сервиса поиска
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_MAX_BATCH_SIZE = 32
+SERVICE_MAX_WAIT_MS = 5
+SERVICE_MAX_TOP_N = 100
+
+# Параметры индекса FAISS
+# Тип индекса: "flat" (точный поиск), "ivf_flat", "ivf_pq", "hnsw",
+# "sq8" / "sq_fp16" (плоский индекс со скалярным квантованием в int8 / float16)
+FAISS_INDEX_TYPE = "flat"
+# Загружать индекс и тексты через memory map (разделяются между процессами)
+FAISS_USE_MMAP = True
+FAISS_TRAIN_SAMPLE_SIZE = 100_000
+FAISS_IVF_NLIST = 1024
+FAISS_IVF_NPROBE = 16
+FAISS_PQ_M = 64
+FAISS_PQ_NBITS = 8
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64
+# Тип хранения embeddings.npy на диске: "float32" или "float16"
+EMBEDDING_STORAGE_DTYPE = "float32"
+# Сколько кандидатов переранжировать точным скалярным произведением по
+# векторам из embeddings.npy (None — без переранжирования)
+FAISS_RERANK_CANDIDATES = None
+# Кеш эмбеддингов запросов (LRU, TTL в секундах, None — без TTL)
+QUERY_EMBEDDING_CACHE_SIZE = 10_000
+QUERY_EMBEDDING_CACHE_TTL = None
+# Кеш top-k результатов, сбрасывается при изменении индекса (0 — отключен)
+SEARCH_RESULT_CACHE_SIZE = 0
+# Прогревать модель тестовым запросом при создании движка
+ENCODER_WARMUP = True
+
+
+# Параметры извлечения ключевых фраз через LLM
+# Бэкенд: "gemini", "openai" (локальный OpenAI-совместимый сервер) или "stub"
+LLM_BACKEND = "gemini"
+LLM_MODEL_NAME = "gemini-2.5-flash"
+LLM_LOCAL_BASE_URL = "http://localhost:8000/v1"
+LLM_LOCAL_MODEL_NAME = "Qwen/Qwen2.5-7B-Instruct"
+LLM_REQUEST_TIMEOUT = 120
+LLM_MAX_REQUESTS_PER_MINUTE = 14
+LLM_MAX_TOKENS_PER_MINUTE = None  # None — без ограничения по токенам
+LLM_CHARS_PER_TOKEN = 3  # грубая оценка для русского текста
+# JSONL-чекпоинт process_all_abstracts_async по умолчанию (None в вызове отключает его)
+LLM_CHECKPOINT_PATH = os.path.join(DATA_DIR, "llm_keyphrases_checkpoint.jsonl")
+# Адаптивное формирование батчей по бюджету токенов
+LLM_BATCH_INPUT_TOKEN_BUDGET = 8000
+LLM_BATCH_OUTPUT_TOKEN_BUDGET = 4000
+LLM_OUTPUT_TOKENS_PER_ABSTRACT = 60
+LLM_MAX_BATCH_SIZE = 50
@@ -0,0 +1,159 @@
+import sys
+import time
+import atexit
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter as PromCounter
+from prometheus_client import Gauge, Histogram, start_http_server
+
+from src import config as cfg
+
+STAGE_SECONDS = Histogram(
+    "keyphrase_stage_duration_seconds",
+    "Время выполнения этапа конвейера",
+    ["component", "stage"],
+    buckets=cfg.METRICS_LATENCY_BUCKETS,
+)
+STAGE_ITEMS = PromCounter(
+    "keyphrase_stage_items",
+    "Число обработанных этапом элементов (запросов, документов, аннотаций)",
+    ["component", "stage"],
+)
+LLM_REQUESTS = PromCounter(
+    "keyphrase_llm_requests",
+    "Запросы к LLM по исходу: success, retry, failed",
+    ["outcome"],
+)
+# Счетчики RateLimiter дублируются в процессные метрики, чтобы они
+# переживали сами объекты limiter'ов между прогонами
+RATE_LIMITER_REQUESTS = PromCounter("keyphrase_llm_rate_limiter_requests",
+                                    "Запросы, прошедшие через rate limiter")
+RATE_LIMITER_WAITS = PromCounter("keyphrase_llm_rate_limiter_waits",
+                                 "Запросы, которым пришлось ждать слот")
+RATE_LIMITER_WAIT_SECONDS = PromCounter("keyphrase_llm_rate_limiter_wait_seconds",
+                                        "Суммарное запланированное время ожидания слотов")
+RATE_LIMITER_RATE_LIMITED = PromCounter("keyphrase_llm_rate_limiter_rate_limited",
+                                        "Полученные ответы 429")
+RATE_LIMITER_RATE_FACTOR = Gauge("keyphrase_llm_rate_limiter_rate_factor",
+                                 "Текущий множитель темпа (1.0 — номинальный)")
+RATE_LIMITER_RATE_FACTOR.set(1.0)
+
+_stage_children: Dict[Tuple[str, str], tuple] = {}
+
+
+def observe_stage(component: str, stage: str, seconds: float, items: int = 1):
+    """Записывает длительность этапа в гистограмму и число обработанных элементов."""
+    children = _stage_children.get((component, stage))
+    if children is None:
+        children = (STAGE_SECONDS.labels(component, stage), STAGE_ITEMS.labels(component, stage))
+        _stage_children[(component, stage)] = children
+    children[0].observe(seconds)
+    children[1].inc(items)
+
+
+@contextmanager
+def stage_timer(component: str, stage: str, items: int = 1) -> Iterator[None]:
+    """Контекстный менеджер: измеряет время блока как этап stage компонента component."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(component, stage, time.perf_counter() - start, items)
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер: фоновый поток раз в interval секунд снимает
+    стеки всех остальных потоков через sys._current_frames() и считает
+    одинаковые стеки. Код не инструментируется, поэтому накладные расходы
+    определяются только частотой семплирования.
+
+    Результат сохраняется в формате collapsed stacks ("f1;f2;f3 count"),
+    который читают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval: float = cfg.PROFILER_INTERVAL, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _format_stack(self, frame) -> str:
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.samples[self._format_stack(frame)] += 1
+
+    def start(self) -> "SamplingProfiler":
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def top(self, n: int = 20) -> List[Tuple[str, int]]:
+        """Функции, чаще всего оказывавшиеся на вершине стека (self time в семплах)."""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def save(self, path: str):
+        """Сохраняет семплы в формате collapsed stacks."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_metrics_server_port: Optional[int] = None
+_profiler: Optional[SamplingProfiler] = None
+
+
+def setup_instrumentation(metrics_port: Optional[int] = cfg.METRICS_PORT,
+                          profiler_output: Optional[str] = cfg.PROFILER_OUTPUT):
+    """
+    Включает то, что задано в конфиге или переменных окружения METRICS_PORT
+    и PROFILER_OUTPUT: HTTP-экспорт метрик Prometheus для процессов без
+    собственного сервера и семплирующий профайлер, который пишет стеки
+    в profiler_output при завершении процесса. Повторные вызовы ничего не делают.
+    """
+    global _metrics_server_port, _profiler
+    if metrics_port and _metrics_server_port is None:
+        start_http_server(metrics_port)
+        _metrics_server_port = metrics_port
+        print(f"Prometheus metrics are exported on port {metrics_port}.")
+
+    if profiler_output and _profiler is None:
+        _profiler = SamplingProfiler().start()
+
+        def save_profile():
+            _profiler.stop()
+            _profiler.save(profiler_output)
+            print(f"Sampling profile saved to {profiler_output}.")
+
+        atexit.register(save_profile)
@@ -0,0 +1,31 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Прокси модуля, который импортирует настоящий модуль при первом
+    обращении к атрибуту. Позволяет не платить за импорт тяжелых
+    зависимостей (torch, faiss, sklearn), пока они не понадобились.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+            self.__dict__.update(self._module.__dict__)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Возвращает модуль name, который будет импортирован при первом использовании."""
+    return LazyModule(name)
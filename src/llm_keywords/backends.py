@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+from src import config as cfg
+from .response_schema import create_json_schema, create_response_schema
+
+SYSTEM_INSTRUCTION = "Ты эксперт по анализу научных текстов. Извлекай наиболее значимые ключевые фразы и термины, которые лучше всего характеризуют содержание каждой аннотации."
+
+@dataclass
+class BackendResponse:
+    """Результат запроса к LLM: разобранный JSON и фактический расход токенов"""
+    parsed: Optional[Dict[str, List[str]]]
+    total_tokens: Optional[int] = None
+
+class LLMBackendError(Exception):
+    """Ошибка бэкенда с HTTP-кодом (для классификации повторов)"""
+
+    def __init__(self, status_code: int, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"{status_code} {message}".strip())
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class LLMBackend(ABC):
+    """
+    Интерфейс бэкенда для извлечения ключевых фраз.
+    generate получает готовый промпт и исходные аннотации батча
+    (последние нужны только заглушке) и возвращает ответ
+    по схеме annotation_1..annotation_N.
+    """
+
+    @abstractmethod
+    async def generate(self, prompt: str, abstracts_batch: List[str]) -> BackendResponse:
+        ...
+
+    async def aclose(self):
+        """Освобождает сетевые ресурсы бэкенда"""
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini через нативный async-клиент SDK"""
+
+    def __init__(self, api_key: Optional[str] = None, model: str = cfg.LLM_MODEL_NAME):
+        self.model = model
+        self.client = genai.Client(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+
+    async def generate(self, prompt: str, abstracts_batch: List[str]) -> BackendResponse:
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=prompt),
+                ],
+            ),
+        ]
+
+        generate_content_config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=create_response_schema(len(abstracts_batch)),
+            system_instruction=[
+                types.Part.from_text(text=SYSTEM_INSTRUCTION),
+            ],
+        )
+
+        # Нативный async-клиент SDK переиспользует пул HTTP-соединений
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=contents,
+            config=generate_content_config,
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return BackendResponse(response.parsed, getattr(usage, "total_token_count", None))
+
+    async def aclose(self):
+        """Закрывает пул HTTP-соединений async-клиента SDK"""
+        await self.client.aio.aclose()
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Локальный OpenAI-совместимый сервер (vLLM, llama.cpp server и т.п.).
+    Структура ответа задается через response_format с JSON Schema.
+    """
+
+    def __init__(self, base_url: str = cfg.LLM_LOCAL_BASE_URL,
+                 model: str = cfg.LLM_LOCAL_MODEL_NAME,
+                 api_key: Optional[str] = None,
+                 timeout: float = cfg.LLM_REQUEST_TIMEOUT,
+                 max_connections: int = 16):
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+
+    async def generate(self, prompt: str, abstracts_batch: List[str]) -> BackendResponse:
+        payload = {
+            "model": self.model,
+            "temperature": 0,
+            "messages": [
+                {"role": "system", "content": SYSTEM_INSTRUCTION},
+                {"role": "user", "content": prompt},
+            ],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "keyphrases",
+                    "schema": create_json_schema(len(abstracts_batch)),
+                },
+            },
+        }
+        response = await self.client.post("/chat/completions", json=payload)
+        if response.status_code >= 400:
+            retry_after = response.headers.get("retry-after")
+            raise LLMBackendError(
+                response.status_code, response.text[:200],
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        body = response.json()
+        content = body["choices"][0]["message"]["content"]
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            parsed = None
+        return BackendResponse(parsed, body.get("usage", {}).get("total_tokens"))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class StubBackend(LLMBackend):
+    """
+    Детерминированная заглушка для офлайн-нагрузочного тестирования.
+    Возвращает ответ по схеме annotation_N (самые частые длинные слова
+    аннотации), имитирует задержку и ответы 429 при превышении RPM,
+    а также случайные 503 с заданной вероятностью (при фиксированном seed).
+    """
+
+    WORD_RE = re.compile(r"[а-яёa-z][а-яёa-z\-]{4,}")
+
+    def __init__(self, latency_seconds: float = 0.5,
+                 latency_per_abstract: float = 0.02,
+                 rate_limit_rpm: Optional[int] = None,
+                 server_error_rate: float = 0.0,
+                 keyphrases_per_abstract: int = 4,
+                 seed: int = 42):
+        self.latency_seconds = latency_seconds
+        self.latency_per_abstract = latency_per_abstract
+        self.rate_limit_rpm = rate_limit_rpm
+        self.server_error_rate = server_error_rate
+        self.keyphrases_per_abstract = keyphrases_per_abstract
+        self._rng = random.Random(seed)
+        self._request_times: deque = deque()
+        self.total_requests = 0
+
+    def _extract(self, abstract: str) -> List[str]:
+        """Детерминированно выбирает ключевые слова аннотации"""
+        words = self.WORD_RE.findall(str(abstract).lower())
+        counts = Counter(words)
+        ranked = sorted(counts, key=lambda word: (-counts[word], -len(word), word))
+        return ranked[:self.keyphrases_per_abstract]
+
+    async def generate(self, prompt: str, abstracts_batch: List[str]) -> BackendResponse:
+        self.total_requests += 1
+        now = time.monotonic()
+
+        if self.rate_limit_rpm:
+            while self._request_times and now - self._request_times[0] >= 60:
+                self._request_times.popleft()
+            if len(self._request_times) >= self.rate_limit_rpm:
+                retry_after = 60 - (now - self._request_times[0])
+                raise LLMBackendError(429, "RESOURCE_EXHAUSTED (stub)", retry_after=retry_after)
+            self._request_times.append(now)
+
+        jitter = self._rng.uniform(0.8, 1.2)
+        await asyncio.sleep((self.latency_seconds + self.latency_per_abstract * len(abstracts_batch)) * jitter)
+
+        if self._rng.random() < self.server_error_rate:
+            raise LLMBackendError(503, "UNAVAILABLE (stub)")
+
+        parsed = {
+            f"annotation_{i + 1}": self._extract(abstract)
+            for i, abstract in enumerate(abstracts_batch)
+        }
+        return BackendResponse(parsed, total_tokens=len(prompt) // cfg.LLM_CHARS_PER_TOKEN)
+
+def create_backend(name: str = cfg.LLM_BACKEND, **kwargs) -> LLMBackend:
+    """Создает бэкенд по имени из конфига: "gemini", "openai" или "stub"."""
+    backends = {
+        "gemini": GeminiBackend,
+        "openai": OpenAICompatibleBackend,
+        "stub": StubBackend,
+    }
+    if name not in backends:
+        raise ValueError(f"Unknown LLM backend '{name}'. Expected one of {tuple(backends)}.")
+    return backends[name](**kwargs)
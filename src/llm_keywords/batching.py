@@ -0,0 +1,36 @@
+from typing import Iterator, List, Optional
+from src import config as cfg
+from .create_batch_prompt import PROMPT_HEADER, format_abstract
+from .extracrt_keyphrases import estimate_tokens
+
+def pack_batches(abstracts: List[str], rows: Optional[List[int]] = None,
+                 input_token_budget: int = cfg.LLM_BATCH_INPUT_TOKEN_BUDGET,
+                 output_token_budget: int = cfg.LLM_BATCH_OUTPUT_TOKEN_BUDGET,
+                 max_batch_size: int = cfg.LLM_MAX_BATCH_SIZE) -> Iterator[List[int]]:
+    """
+    Жадно упаковывает аннотации в батчи по бюджету токенов.
+
+    Батч закрывается, когда следующая аннотация не помещается во входной
+    бюджет промпта или когда ожидаемый ответ превысит выходной бюджет.
+    Аннотация длиннее всего бюджета уходит отдельным батчем.
+
+    Returns:
+        Iterator[List[int]]: Номера строк (из rows) для каждого батча в исходном порядке.
+    """
+    if rows is None:
+        rows = list(range(len(abstracts)))
+    max_abstracts = max(1, min(max_batch_size, output_token_budget // cfg.LLM_OUTPUT_TOKENS_PER_ABSTRACT))
+    header_tokens = estimate_tokens(PROMPT_HEADER)
+
+    batch: List[int] = []
+    batch_tokens = header_tokens
+    for row in rows:
+        abstract_tokens = estimate_tokens(format_abstract(abstracts[row], len(batch) + 1))
+        if batch and (batch_tokens + abstract_tokens > input_token_budget
+                      or len(batch) >= max_abstracts):
+            yield batch
+            batch, batch_tokens = [], header_tokens
+        batch.append(row)
+        batch_tokens += abstract_tokens
+    if batch:
+        yield batch
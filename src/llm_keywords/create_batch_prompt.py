@@ -1,12 +1,17 @@
 from typing import List
 
-def create_batch_prompt(abstracts_batch: List[str], start_idx: int) -> str:
+PROMPT_HEADER = "Извлеки 2-5 ключевых фраз/слов из каждой аннотации. Ключевые фразы должны отражать основную тематику и важные концепции.\n\n"
+
+def format_abstract(abstract: str, number: int) -> str:
+    """
+    Форматирует одну аннотацию для промпта (нумерация внутри батча с 1)
+    """
+    return f"Аннотация {number}:\n{abstract}\n\n"
+
+def create_batch_prompt(abstracts_batch: List[str]) -> str:
     """
     Создает промпт для батча аннотаций
     """
-    prompt = "Извлеки 2-5 ключевых фраз/слов из каждой аннотации. Ключевые фразы должны отражать основную тематику и важные концепции.\n\n"
-    
-    for i, abstract in enumerate(abstracts_batch):
-        prompt += f"Аннотация {start_idx + i + 1}:\n{abstract}\n\n"
-    
-    return prompt
\ No newline at end of file
+    return PROMPT_HEADER + "".join(
+        format_abstract(abstract, i + 1) for i, abstract in enumerate(abstracts_batch)
+    )
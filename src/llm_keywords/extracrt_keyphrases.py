@@ -1,107 +1,206 @@
-from typing import List
-from typing import Dict
-from google.genai import types
-from .response_schema import create_response_schema
-from .create_batch_prompt import create_batch_prompt
-
 import time
+import httpx
 import asyncio
-import threading
-from google.genai import types
-from typing import Dict, List, Optional
-from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from google.genai import errors
+from typing import Dict, List, Optional, Tuple
+from src import config as cfg
+from src import instrumentation
+from .backends import LLMBackend, LLMBackendError
+from .create_batch_prompt import create_batch_prompt
+
+def estimate_tokens(text: str) -> int:
+    """Грубо оценивает число токенов в тексте по его длине"""
+    return max(1, len(text) // cfg.LLM_CHARS_PER_TOKEN)
+
+RATE_LIMIT_STATUS_CODES = {429}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def classify_error(error: Exception) -> Tuple[bool, bool]:
+    """
+    Классифицирует ошибку по типу и HTTP-коду.
+    Возвращает (это rate limit, можно ли повторить запрос).
+    """
+    if isinstance(error, errors.APIError):
+        return error.code in RATE_LIMIT_STATUS_CODES, error.code in RETRYABLE_STATUS_CODES
+    if isinstance(error, LLMBackendError):
+        return error.status_code in RATE_LIMIT_STATUS_CODES, error.status_code in RETRYABLE_STATUS_CODES
+    # Ошибки ответа aiohttp несут HTTP-код, который уже разобран выше
+    # (APIError SDK), поэтому повторяются только транспортные сбои
+    if isinstance(error, aiohttp.ClientResponseError):
+        return False, False
+    if isinstance(error, (httpx.TransportError, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)):
+        return False, True
+    return False, False
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Достает рекомендованную паузу из заголовка Retry-After или RetryInfo в ответе"""
+    if isinstance(error, LLMBackendError):
+        return error.retry_after
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None and headers.get("retry-after"):
+        try:
+            return float(headers.get("retry-after"))
+        except ValueError:
+            pass
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            retry_delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if retry_delay and retry_delay.endswith("s"):
+                try:
+                    return float(retry_delay[:-1])
+                except ValueError:
+                    pass
+    return None
 
 class RateLimiter:
-    """Rate limiter для контроля количества запросов в минуту"""
+    """
+    Асинхронный rate limiter на основе token bucket.
+    Ограничивает число запросов (RPM) и, опционально, токенов (TPM) в минуту.
+    После ответа 429 временно снижает темп и плавно восстанавливает его.
+    Счетчики экспортируются в Prometheus (src.instrumentation).
+    """
     
-    def __init__(self, max_requests_per_minute: int = 15):
+    def __init__(self, max_requests_per_minute: int = cfg.LLM_MAX_REQUESTS_PER_MINUTE,
+                 max_tokens_per_minute: Optional[int] = cfg.LLM_MAX_TOKENS_PER_MINUTE,
+                 burst: int = 1,
+                 min_rate_factor: float = 0.25):
         self.max_requests = max_requests_per_minute
-        self.requests = []
-        self.lock = threading.Lock()
+        self.max_tokens = max_tokens_per_minute
+        self.burst = burst
+        self.min_rate_factor = min_rate_factor
+        self.rate_factor = 1.0
+        
+        self._request_bucket = float(burst)
+        self._token_bucket = float(max_tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        
         self.total_requests = 0
         self.total_waits = 0
+        self.total_wait_time = 0.0
+        self.total_rate_limited = 0
     
-    async def acquire(self):
-        """Ждет, пока не появится слот для запроса"""
-        with self.lock:
+    def _refill(self, now: float):
+        """Пополняет корзины пропорционально прошедшему времени"""
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        request_rate = self.max_requests / 60.0 * self.rate_factor
+        self._request_bucket = min(self.burst, self._request_bucket + elapsed * request_rate)
+        if self.max_tokens:
+            token_rate = self.max_tokens / 60.0 * self.rate_factor
+            self._token_bucket = min(self.max_tokens, self._token_bucket + elapsed * token_rate)
+    
+    def _time_until_available(self, now: float, tokens: int) -> float:
+        """Сколько секунд ждать, пока в корзинах хватит запросов и токенов"""
+        wait = max(0.0, self._blocked_until - now)
+        request_rate = self.max_requests / 60.0 * self.rate_factor
+        if self._request_bucket < 1.0:
+            wait = max(wait, (1.0 - self._request_bucket) / request_rate)
+        if self.max_tokens and tokens:
+            token_rate = self.max_tokens / 60.0 * self.rate_factor
+            if self._token_bucket < tokens:
+                wait = max(wait, (tokens - self._token_bucket) / token_rate)
+        return wait
+    
+    async def acquire(self, tokens: int = 0):
+        """
+        Ждет, пока не появится слот для запроса с заданной оценкой токенов.
+        asyncio.Lock не блокирует event loop и выдает слоты в порядке очереди.
+        """
+        if self.max_tokens:
+            # Запрос больше минутного бюджета все равно должен когда-то пройти
+            tokens = min(tokens, self.max_tokens)
+        
+        start_time = time.perf_counter()
+        async with self._lock:
             self.total_requests += 1
-            now = time.time()
-            self.requests = [req_time for req_time in self.requests if now - req_time < 60]
-            
-            if len(self.requests) >= self.max_requests:
-                sleep_time = 60 - (now - self.requests[0]) + 0.1
-                self.total_waits += 1
-                print(f"⏳ Rate limit: ожидание {sleep_time:.1f}с (запрос #{self.total_requests})")
+            instrumentation.RATE_LIMITER_REQUESTS.inc()
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                sleep_time = self._time_until_available(now, tokens)
+                if sleep_time <= 0:
+                    break
+                if not waited:
+                    waited = True
+                    self.total_waits += 1
+                    instrumentation.RATE_LIMITER_WAITS.inc()
+                self.total_wait_time += sleep_time
+                instrumentation.RATE_LIMITER_WAIT_SECONDS.inc(sleep_time)
                 await asyncio.sleep(sleep_time)
-                return await self.acquire()
             
-            self.requests.append(now)
+            self._request_bucket -= 1.0
+            if self.max_tokens:
+                self._token_bucket -= tokens
+        instrumentation.observe_stage("llm", "rate_limit_wait", time.perf_counter() - start_time)
+    
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Корректирует корзину токенов по фактическому расходу из ответа API"""
+        if self.max_tokens and actual_tokens is not None:
+            self._token_bucket -= actual_tokens - estimated_tokens
+    
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """Реакция на 429: пауза для всех запросов и снижение темпа вдвое"""
+        self.total_rate_limited += 1
+        self.rate_factor = max(self.min_rate_factor, self.rate_factor * 0.5)
+        instrumentation.RATE_LIMITER_RATE_LIMITED.inc()
+        instrumentation.RATE_LIMITER_RATE_FACTOR.set(self.rate_factor)
+        pause = retry_after if retry_after is not None else 60.0 / (self.max_requests * self.rate_factor)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+    
+    def on_success(self):
+        """Плавно возвращает темп к номинальному после успешных запросов"""
+        if self.rate_factor < 1.0:
+            self.rate_factor = min(1.0, self.rate_factor + 0.1)
+            instrumentation.RATE_LIMITER_RATE_FACTOR.set(self.rate_factor)
 
-async def extract_keyphrases_batch_async(client, abstracts_batch: List[str], 
+async def extract_keyphrases_batch_async(backend: LLMBackend, abstracts_batch: List[str], 
                                        start_idx: int, batch_idx: int, 
                                        rate_limiter: RateLimiter,
-                                       model: str = "gemini-2.5-flash",
                                        max_retries: int = 3) -> tuple[int, Optional[Dict]]:
-    """Асинхронно извлекает ключевые фразы для батча аннотаций с повторными попытками"""
+    """
+    Асинхронно извлекает ключевые фразы для батча аннотаций с повторными попытками.
+    Ключи ответа относительные: annotation_1..annotation_N в порядке батча,
+    start_idx используется только в логах.
+    """
     
-    prompt = create_batch_prompt(abstracts_batch, start_idx)
-    schema = create_response_schema(len(abstracts_batch), start_idx)
+    prompt = create_batch_prompt(abstracts_batch)
     
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(text=prompt),
-            ],
-        ),
-    ]
-    
-    generate_content_config = types.GenerateContentConfig(
-        response_mime_type="application/json",
-        response_schema=schema,
-        system_instruction=[
-            types.Part.from_text(
-                text="Ты эксперт по анализу научных текстов. Извлекай наиболее значимые ключевые фразы и термины, которые лучше всего характеризуют содержание каждой аннотации."
-            ),
-        ],
-    )
+    estimated_tokens = estimate_tokens(prompt)
     
     for attempt in range(max_retries + 1):
         try:
-            await rate_limiter.acquire()
-            
-            print(f"Отправка батча {batch_idx + 1} (аннотации {start_idx + 1}-{start_idx + len(abstracts_batch)})" + 
-                  (f" - попытка {attempt + 1}" if attempt > 0 else ""))
+            await rate_limiter.acquire(tokens=estimated_tokens)
             
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                response = await loop.run_in_executor(
-                    executor, 
-                    lambda: client.models.generate_content(
-                        model=model,
-                        contents=contents,
-                        config=generate_content_config,
-                    )
-                )
+            with instrumentation.stage_timer("llm", "llm_request", items=len(abstracts_batch)):
+                response = await backend.generate(prompt, abstracts_batch)
             
-            print(f"✓ Батч {batch_idx + 1} обработан успешно" + 
-                  (f" (попытка {attempt + 1})" if attempt > 0 else ""))
+            rate_limiter.record_usage(estimated_tokens, response.total_tokens)
+            rate_limiter.on_success()
+            instrumentation.LLM_REQUESTS.labels("success").inc()
             return batch_idx, response.parsed
             
         except Exception as e:
-            error_msg = str(e)
-            is_rate_limit_error = "429" in error_msg or "quota" in error_msg.lower()
-            is_server_error = "503" in error_msg or "502" in error_msg or "overloaded" in error_msg.lower()
-            is_retryable = is_rate_limit_error or is_server_error
+            is_rate_limit_error, is_retryable = classify_error(e)
+            retry_after = get_retry_after(e)
+            if is_rate_limit_error:
+                rate_limiter.on_rate_limited(retry_after)
             
             if attempt < max_retries and is_retryable:
-                delay = (2 ** attempt) * 5
+                delay = max((2 ** attempt) * 5, retry_after or 0)
+                instrumentation.LLM_REQUESTS.labels("retry").inc()
                 print(f"⚠️  Ошибка в батче {batch_idx + 1} (попытка {attempt + 1}): {e}")
                 print(f"   Повтор через {delay} секунд...")
                 await asyncio.sleep(delay)
                 continue
             else:
-                print(f"✗ Батч {batch_idx + 1} окончательно не обработан после {attempt + 1} попыток: {e}")
+                instrumentation.LLM_REQUESTS.labels("failed").inc()
+                print(f"✗ Батч {batch_idx + 1} (аннотации {start_idx + 1}-{start_idx + len(abstracts_batch)}) "
+                      f"окончательно не обработан после {attempt + 1} попыток: {e}")
                 return batch_idx, None
     
     return batch_idx, None
\ No newline at end of file
@@ -1,10 +1,16 @@
+import os
 import pandas as pd
+from typing import Optional, Sequence
+from src.config import DATA_DIR
 
-def load_and_sample_data(file_path: str, sample_size: int = 200) -> pd.DataFrame:
+def load_and_sample_data(file_path: str = os.path.join(DATA_DIR, "df_cleaned.parquet"),
+                         sample_size: int = 200,
+                         columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
     """
-    Загружает данные и выбирает случайную выборку
+    Загружает данные и выбирает случайную выборку.
+    Читаются только колонки columns (None — все колонки).
     """
-    df = pd.read_parquet(file_path)
+    df = pd.read_parquet(file_path, columns=list(columns) if columns is not None else None)
     print(f"Загружено {len(df)} аннотаций")
     
     # Выбираем случайные 200 аннотаций
@@ -1,10 +1,44 @@
+import os
+import json
 import pandas as pd
+from typing import Dict, List
+from src.config import DATA_DIR
 
-def save_results(df: pd.DataFrame, output_path: str = "../data/df_with_llmkeyphrases.parquet"):
+def save_results(df: pd.DataFrame, output_path: str = os.path.join(DATA_DIR, "df_with_llmkeyphrases.parquet")):
     """Сохраняет результаты в файл"""
     df.to_parquet(output_path, index=False)
     print(f"\n💾 Результаты сохранены в {output_path}")
 
+def load_checkpoint(checkpoint_path: str) -> Dict[str, List[str]]:
+    """Читает уже обработанные аннотации из JSONL-чекпоинта"""
+    completed = {}
+    if not os.path.exists(checkpoint_path):
+        return completed
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла оборваться при падении процесса
+                continue
+            completed[record["abstract_id"]] = record["keyphrases"]
+    return completed
+
+def append_checkpoint(checkpoint_path: str, records: List[Dict]):
+    """Дописывает результаты батча в JSONL-чекпоинт и сбрасывает их на диск"""
+    if not records:
+        return
+    directory = os.path.dirname(checkpoint_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(checkpoint_path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+
 def display_sample_results(df: pd.DataFrame, n_samples: int = 3):
     """Показывает примеры результатов"""
     print(f"\n=== ПРИМЕРЫ РЕЗУЛЬТАТОВ ===")
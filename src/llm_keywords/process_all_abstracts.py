@@ -1,86 +1,146 @@
-import os
 import time
 import asyncio
+import xxhash
 import pandas as pd
-import pandas as pd
-from google import genai
+from typing import List, Optional
+from src import config as cfg
+from src.instrumentation import observe_stage, setup_instrumentation
+from .backends import LLMBackend, create_backend
 from .extracrt_keyphrases import RateLimiter
 from .extracrt_keyphrases import extract_keyphrases_batch_async
+from .batching import pack_batches
+from .on_result import append_checkpoint, load_checkpoint
+
+def make_abstract_id(abstract: str) -> str:
+    """Стабильный id аннотации по ее содержимому (не зависит от порядка строк)"""
+    return xxhash.xxh3_64_hexdigest(str(abstract).encode("utf-8"))
+
+async def process_all_abstracts_async(df: pd.DataFrame, batch_size: int = cfg.LLM_MAX_BATCH_SIZE,
+                                    max_concurrent: int = 5,
+                                    max_retries: int = 3,
+                                    checkpoint_path: Optional[str] = cfg.LLM_CHECKPOINT_PATH,
+                                    token_budget: int = cfg.LLM_BATCH_INPUT_TOKEN_BUDGET,
+                                    backend: Optional[LLMBackend] = None,
+                                    rate_limiter: Optional[RateLimiter] = None) -> pd.DataFrame:
+    """
+    Обрабатывает все аннотации батчами с повторными попытками.
+
+    Батчи собираются по бюджету токенов (token_budget на промпт), но не
+    больше batch_size аннотаций, поэтому короткие аннотации упаковываются
+    плотнее, а длинные не переполняют ответ.
+
+    Батчи раздаются max_concurrent воркерам через очередь, и результат
+    каждого батча сразу записывается в DataFrame. Результаты дописываются
+    в JSONL-чекпоинт checkpoint_path (по умолчанию cfg.LLM_CHECKPOINT_PATH),
+    а при перезапуске уже обработанные аннотации пропускаются;
+    checkpoint_path=None отключает чекпоинт.
+
+    backend по умолчанию создается по cfg.LLM_BACKEND; для офлайн-прогонов
+    можно передать StubBackend или OpenAICompatibleBackend.
+
+    Время запросов и ожидания rate limiter пишется в метрики Prometheus;
+    экспорт и профайлер включаются через METRICS_PORT и PROFILER_OUTPUT.
+    """
+    setup_instrumentation()
+
+    owns_backend = backend is None
+    if owns_backend:
+        backend = create_backend()
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
 
-async def process_all_abstracts_async(df: pd.DataFrame, batch_size: int = 20, 
-                                    max_concurrent: int = 5, 
-                                    max_retries: int = 3) -> pd.DataFrame:
-    """Обрабатывает все аннотации батчами с повторными попытками"""
-    
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    rate_limiter = RateLimiter(max_requests_per_minute=14)
-    
     df = df.copy()
     df['keyphrases'] = None
     df['keyphrases'] = df['keyphrases'].astype('object')
-    
+
     abstracts = df['abstract'].tolist()
-    total_batches = (len(abstracts) + batch_size - 1) // batch_size
-    
-    print(f"Будет обработано {total_batches} батчей по {batch_size} аннотаций")
+    abstract_ids = [make_abstract_id(abstract) for abstract in abstracts]
+
+    completed = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    pending_rows = []
+    for row, abstract_id in enumerate(abstract_ids):
+        if abstract_id in completed:
+            df.at[row, 'keyphrases'] = completed[abstract_id]
+        else:
+            pending_rows.append(row)
+    del completed
+
+    if checkpoint_path:
+        print(f"Из чекпоинта {checkpoint_path} восстановлено {len(abstracts) - len(pending_rows)} аннотаций")
+
+    batches = list(pack_batches(abstracts, pending_rows, input_token_budget=token_budget,
+                                max_batch_size=batch_size))
+    total_batches = len(batches)
+
+    print(f"Будет обработано {total_batches} батчей (до {batch_size} аннотаций, "
+          f"до ~{token_budget} токенов в промпте)")
     print(f"Максимум одновременных запросов: {max_concurrent}")
     print(f"Максимум повторных попыток: {max_retries}")
-    
-    tasks = []
-    for batch_idx in range(total_batches):
-        start_idx = batch_idx * batch_size
-        end_idx = min(start_idx + batch_size, len(abstracts))
-        current_batch = abstracts[start_idx:end_idx]
-        
-        task = extract_keyphrases_batch_async(
-            client, current_batch, start_idx, batch_idx, rate_limiter, 
-            max_retries=max_retries
-        )
-        tasks.append(task)
-    
-    semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def bounded_task(task):
-        async with semaphore:
-            return await task
-    
-    bounded_tasks = [bounded_task(task) for task in tasks]
-    
+
+    if total_batches == 0:
+        print("Все аннотации уже обработаны")
+        if owns_backend:
+            await backend.aclose()
+        return df
+
+    queue: asyncio.Queue = asyncio.Queue()
+    start_idx = 0
+    for batch_idx, rows in enumerate(batches):
+        queue.put_nowait((batch_idx, start_idx, rows))
+        start_idx += len(rows)
+
+    stats = {"successful": 0, "failed": 0}
+
+    def handle_result(rows: List[int], parsed_result: Optional[dict]):
+        if not parsed_result:
+            stats["failed"] += 1
+            return
+        stats["successful"] += 1
+        records = []
+        for i, row in enumerate(rows):
+            key = f"annotation_{i + 1}"
+            if key in parsed_result:
+                keyphrases_list = parsed_result[key]
+                df.at[row, 'keyphrases'] = keyphrases_list
+                records.append({"abstract_id": abstract_ids[row], "keyphrases": keyphrases_list})
+        if checkpoint_path:
+            append_checkpoint(checkpoint_path, records)
+
+    async def worker():
+        while True:
+            try:
+                batch_idx, start_idx, rows = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                _, parsed_result = await extract_keyphrases_batch_async(
+                    backend, [abstracts[row] for row in rows], start_idx, batch_idx,
+                    rate_limiter, max_retries=max_retries
+                )
+                handle_result(rows, parsed_result)
+            except Exception as e:
+                print(f"Критическое исключение в батче {batch_idx + 1}: {e}")
+                stats["failed"] += 1
+
     print("\n🚀 Запуск параллельной обработки...")
-    start_time = time.time()
-    
-    results = await asyncio.gather(*bounded_tasks, return_exceptions=True)
-    
-    end_time = time.time()
-    
-    successful_batches = 0
-    failed_batches = 0
-    retry_stats = {}
-    
-    for result in results:
-        if isinstance(result, Exception):
-            print(f"Критическое исключение в одном из батчей: {result}")
-            failed_batches += 1
-            continue
-            
-        batch_idx, parsed_result = result
-        if parsed_result:
-            successful_batches += 1
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, len(abstracts))
-            
-            for i, idx in enumerate(range(start_idx, end_idx)):
-                key = f"annotation_{idx + 1}"
-                if key in parsed_result:
-                    keyphrases_list = parsed_result[key]
-                    df.at[idx, 'keyphrases'] = keyphrases_list
-        else:
-            failed_batches += 1
-    
+    start_time = time.perf_counter()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(max_concurrent, total_batches))))
+    finally:
+        if owns_backend:
+            await backend.aclose()
+
+    elapsed = time.perf_counter() - start_time
+    observe_stage("llm", "pipeline", elapsed, items=len(pending_rows))
+
+    successful_batches = stats["successful"]
+    failed_batches = stats["failed"]
+
     print(f"\n=== 📊 ДЕТАЛЬНАЯ СТАТИСТИКА ===")
     print(f"✅ Успешно обработано: {successful_batches}/{total_batches} батчей")
     print(f"❌ Не удалось обработать: {failed_batches}/{total_batches} батчей")
     print(f"📈 Процент успеха: {successful_batches/total_batches*100:.1f}%")
-    print(f"\n⏱️  Обработка завершена за {end_time - start_time:.1f} секунд")
-    
-    return df
\ No newline at end of file
+    print(f"\n⏱️  Обработка завершена за {elapsed:.1f} секунд")
+
+    return df
@@ -1,12 +1,16 @@
+from functools import lru_cache
 from google import genai
 
-def create_response_schema(batch_size: int, start_idx: int) -> genai.types.Schema:
+@lru_cache(maxsize=None)
+def create_response_schema(batch_size: int) -> genai.types.Schema:
     """
-    Создает схему ответа для батча
+    Создает схему ответа для батча.
+    Ключи относительные (annotation_1..annotation_N), поэтому схема
+    зависит только от размера батча и кешируется.
     """
     properties = {}
     for i in range(batch_size):
-        key = f"annotation_{start_idx + i + 1}"
+        key = f"annotation_{i + 1}"
         properties[key] = genai.types.Schema(
             type=genai.types.Type.ARRAY,
             items=genai.types.Schema(
@@ -17,4 +21,20 @@ def create_response_schema(batch_size: int, start_idx: int) -> genai.types.Schem
     return genai.types.Schema(
         type=genai.types.Type.OBJECT,
         properties=properties,
-    )
\ No newline at end of file
+    )
+
+@lru_cache(maxsize=None)
+def create_json_schema(batch_size: int) -> dict:
+    """
+    Та же схема ответа в формате JSON Schema
+    для OpenAI-совместимых серверов (vLLM, llama.cpp).
+    """
+    properties = {
+        f"annotation_{i + 1}": {"type": "array", "items": {"type": "string"}}
+        for i in range(batch_size)
+    }
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+    }
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import psutil
+
+from src import config as cfg
+from .metrics_emb import compute_ranking_metrics, results_to_id_matrix
+
+
+def get_peak_rss_mb() -> float:
+    """Пиковый RSS процесса с момента запуска, МБ (ru_maxrss в Linux — КБ, в macOS — байты)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def get_rss_mb() -> float:
+    """Текущий RSS процесса, МБ."""
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _reset_caches(search_engine):
+    """Сбрасывает кеши запросов движка, чтобы замеры не зависели от прошлых прогонов."""
+    for name in ("query_cache", "result_cache"):
+        cache = getattr(search_engine, name, None)
+        if cache is not None:
+            cache.clear()
+
+
+def _search_batch(search_engine, queries: List[str], top_n: int, **search_kwargs) -> List[list]:
+    """Вызывает search_batch, а если его нет — search для каждого запроса."""
+    if hasattr(search_engine, "search_batch"):
+        return search_engine.search_batch(queries, top_n=top_n, **search_kwargs)
+    return [search_engine.search(query, top_n=top_n, **search_kwargs) for query in queries]
+
+
+def measure_build(build_func: Callable[[], object]) -> Tuple[object, Dict[str, float]]:
+    """
+    Строит индекс через build_func и замеряет время и память.
+
+    Returns:
+        Tuple[object, Dict[str, float]]: Результат build_func и статистика
+            (build_seconds, rss_delta_mb, peak_rss_mb).
+    """
+    rss_before = get_rss_mb()
+    start_time = time.perf_counter()
+    result = build_func()
+    build_seconds = time.perf_counter() - start_time
+    return result, {
+        "build_seconds": build_seconds,
+        "rss_delta_mb": get_rss_mb() - rss_before,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def measure_latency(search_engine, queries: Sequence[str], top_n: int,
+                    **search_kwargs) -> Dict[str, float]:
+    """Латентность одиночных запросов (p50/p95/p99 и среднее), мс."""
+    _reset_caches(search_engine)
+    latencies = np.empty(len(queries), dtype=np.float64)
+    for i, query in enumerate(queries):
+        start_time = time.perf_counter()
+        _search_batch(search_engine, [query], top_n, **search_kwargs)
+        latencies[i] = time.perf_counter() - start_time
+    latencies *= 1000.0
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(latencies.mean()),
+    }
+
+
+def measure_throughput(search_engine, queries: Sequence[str], top_n: int,
+                       batch_sizes: Sequence[int], **search_kwargs) -> Dict[str, float]:
+    """Пропускная способность (запросов в секунду) для каждого размера батча."""
+    throughput = {}
+    queries = list(queries)
+    for batch_size in batch_sizes:
+        _reset_caches(search_engine)
+        start_time = time.perf_counter()
+        for start in range(0, len(queries), batch_size):
+            _search_batch(search_engine, queries[start:start + batch_size], top_n, **search_kwargs)
+        elapsed = time.perf_counter() - start_time
+        throughput[str(batch_size)] = len(queries) / elapsed if elapsed > 0 else float("inf")
+    return throughput
+
+
+def benchmark_engine(search_engine, ground_truth: Dict[str, Sequence[int]],
+                     top_n: int = cfg.TOP_N_SEARCH,
+                     batch_sizes: Sequence[int] = cfg.BENCHMARK_BATCH_SIZES,
+                     **search_kwargs) -> Dict[str, object]:
+    """
+    Прогоняет движок по разметке {запрос: [id релевантных]} и собирает
+    качество (MRR, Precision/Recall/nDCG@k), латентность и QPS.
+    Движок должен поддерживать search или search_batch с аргументом top_n;
+    дополнительные аргументы (например, preprocessor_func) передаются в search_kwargs.
+    """
+    queries = list(ground_truth.keys())
+    _reset_caches(search_engine)
+    batch_results = _search_batch(search_engine, queries, top_n, **search_kwargs)
+    quality = compute_ranking_metrics(
+        results_to_id_matrix(batch_results, top_n), list(ground_truth.values()), top_n
+    )
+    return {
+        "num_queries": len(queries),
+        "top_n": top_n,
+        "quality": quality,
+        "latency": measure_latency(search_engine, queries, top_n, **search_kwargs),
+        "qps": measure_throughput(search_engine, queries, top_n, batch_sizes, **search_kwargs),
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def make_synthetic_corpus(df: pd.DataFrame, n_docs: int, n_queries: int = 200,
+                          query_words: int = 12, keep_prob: float = 0.85,
+                          seed: int = 42) -> Tuple[pd.DataFrame, Dict[str, List[int]]]:
+    """
+    Масштабирует корпус до n_docs документов: каждый синтетический
+    документ — копия случайной аннотации с выброшенными словами
+    (отдельно для abstract и lemmatized_abstract).
+
+    Запрос — окно из query_words слов исходной аннотации; релевантны все
+    синтетические документы, порожденные той же аннотацией.
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, List[int]]]: Корпус с колонками
+            abstract и lemmatized_abstract и разметка для запросов.
+    """
+    rng = np.random.default_rng(seed)
+    base_ids = rng.integers(0, len(df), size=n_docs)
+    abstracts = df["abstract"].astype(str).tolist()
+    lemmatized = df["lemmatized_abstract"].astype(str).tolist()
+
+    def perturb(text: str) -> str:
+        words = text.split()
+        keep = rng.random(len(words)) < keep_prob
+        return " ".join(word for word, kept in zip(words, keep) if kept) or text
+
+    corpus = pd.DataFrame({
+        "abstract": [perturb(abstracts[base_id]) for base_id in base_ids],
+        "lemmatized_abstract": [perturb(lemmatized[base_id]) for base_id in base_ids],
+    })
+
+    docs_by_base: Dict[int, List[int]] = {}
+    for doc_id, base_id in enumerate(base_ids.tolist()):
+        docs_by_base.setdefault(base_id, []).append(doc_id)
+
+    ground_truth: Dict[str, List[int]] = {}
+    candidate_bases = list(docs_by_base)
+    for base_id in rng.permutation(candidate_bases)[:n_queries].tolist():
+        words = abstracts[base_id].split()
+        start = int(rng.integers(0, max(1, len(words) - query_words + 1)))
+        query = " ".join(words[start:start + query_words])
+        if query and query not in ground_truth:
+            ground_truth[query] = docs_by_base[base_id]
+    return corpus, ground_truth
+
+
+def get_environment_info() -> Dict[str, object]:
+    """Сведения о запуске для сравнения результатов между прогонами."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_report(report: Dict[str, object], output_path: str):
+    """Сохраняет отчет бенчмарка в JSON."""
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Benchmark report saved to {output_path}")
+
+
+def run_benchmark(df: pd.DataFrame, corpus_sizes: Sequence[int] = cfg.BENCHMARK_CORPUS_SIZES,
+                  engines: Sequence[str] = ("tfidf", "embeddings"),
+                  n_queries: int = 200, top_n: int = cfg.TOP_N_SEARCH,
+                  batch_sizes: Sequence[int] = cfg.BENCHMARK_BATCH_SIZES,
+                  work_dir: str = cfg.BENCHMARK_WORK_DIR,
+                  rerank_candidates: Optional[int] = cfg.FAISS_RERANK_CANDIDATES,
+                  output_path: Optional[str] = cfg.BENCHMARK_OUTPUT_PATH) -> Dict[str, object]:
+    """
+    Строит TF-IDF и/или FAISS индексы на синтетических корпусах заданных
+    размеров и измеряет для каждого время построения, память, качество,
+    латентность и QPS. Результат сохраняется в output_path.
+    Движок эмбеддингов задается как "embeddings" или "embeddings:<index_type>"
+    (например, "embeddings:sq8"), чтобы сравнить сжатые индексы с точным.
+    Каждый прогон эмбеддингов идет в новой временной директории внутри
+    work_dir с force_rebuild=True, поэтому build_seconds всегда включает
+    кодирование и построение индекса, а не загрузку прошлых результатов.
+    """
+    from src.classic_keywords.preprocessing import preprocess_text
+
+    report = {"environment": get_environment_info(), "runs": []}
+    for n_docs in corpus_sizes:
+        corpus, ground_truth = make_synthetic_corpus(df, n_docs, n_queries=n_queries)
+        print(f"\n=== Corpus of {n_docs} documents, {len(ground_truth)} queries ===")
+
+        for engine_name in engines:
+            run_dir = None
+            if engine_name == "tfidf":
+                from src.search_tf_idf.search import TfidfSearch
+                search_engine = TfidfSearch()
+                _, build_stats = measure_build(lambda: search_engine.build_index(
+                    corpus["lemmatized_abstract"], corpus["abstract"]
+                ))
+                search_kwargs = {"preprocessor_func": preprocess_text}
+            elif engine_name.startswith("embeddings"):
+                from src.search_embeddings.engine import EmbeddingSearchEngine
+                # "embeddings" или "embeddings:<index_type>", например "embeddings:sq8"
+                index_type = engine_name.partition(":")[2] or cfg.FAISS_INDEX_TYPE
+                os.makedirs(work_dir, exist_ok=True)
+                run_dir = tempfile.mkdtemp(prefix=f"embeddings_{n_docs}_{index_type}_", dir=work_dir)
+                search_engine = EmbeddingSearchEngine(
+                    embedding_path=os.path.join(run_dir, f"embeddings_{index_type}.npy"),
+                    faiss_index_path=os.path.join(run_dir, f"faiss_index_{index_type}.bin"),
+                    embedding_cache_path=os.path.join(run_dir, "embedding_cache"),
+                    index_type=index_type,
+                    rerank_candidates=rerank_candidates,
+                )
+                _, build_stats = measure_build(
+                    lambda: search_engine.build_index(corpus["abstract"], force_rebuild=True)
+                )
+                build_stats["storage"] = search_engine.storage_report()
+                search_kwargs = {}
+            else:
+                raise ValueError(f"Unknown engine '{engine_name}'. Expected 'tfidf' or 'embeddings[:index_type]'.")
+
+            result = benchmark_engine(search_engine, ground_truth, top_n=top_n,
+                                      batch_sizes=batch_sizes, **search_kwargs)
+            result.update({"engine": engine_name, "num_documents": n_docs, "build": build_stats})
+            report["runs"].append(result)
+            if run_dir is not None:
+                shutil.rmtree(run_dir, ignore_errors=True)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if output_path:
+        save_report(report, output_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк качества и производительности поиска")
+    parser.add_argument("--dataset", default="df_with_llmkeyphrases",
+                        help="Имя parquet-файла в data/ с колонками abstract и lemmatized_abstract")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(cfg.BENCHMARK_CORPUS_SIZES))
+    parser.add_argument("--engines", nargs="+", default=["tfidf", "embeddings"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=cfg.TOP_N_SEARCH)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(cfg.BENCHMARK_BATCH_SIZES))
+    parser.add_argument("--rerank-candidates", type=int, default=cfg.FAISS_RERANK_CANDIDATES)
+    parser.add_argument("--output", default=cfg.BENCHMARK_OUTPUT_PATH)
+    args = parser.parse_args()
+
+    from src.utils import load_dataset
+    dataset = load_dataset(args.dataset)
+    if dataset is None:
+        sys.exit(1)
+    run_benchmark(dataset, corpus_sizes=args.sizes, engines=args.engines, n_queries=args.queries,
+                  top_n=args.top_n, batch_sizes=args.batch_sizes,
+                  rerank_candidates=args.rerank_candidates, output_path=args.output)
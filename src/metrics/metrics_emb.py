@@ -1,35 +1,78 @@
-def evaluate_search_engine(search_engine, queries, ground_truth, top_n=5, **search_kwargs):
-    metrics = {
-        "mrr": [],         # Mean Reciprocal Rank
-        "precision_at_5": [] # Точность на 5 результатах
+import numpy as np
+from typing import Dict, List, Sequence
+
+
+def results_to_id_matrix(batch_results: Sequence[Sequence[tuple]], top_n: int) -> np.ndarray:
+    """
+    Собирает id найденных документов в матрицу запрос × ранг.
+    Любой движок возвращает кортежи, у которых первый элемент — id документа
+    (TF-IDF: (индекс, текст), эмбеддинги и гибрид: (индекс, текст, скор)).
+    Недостающие позиции заполняются -1.
+    """
+    retrieved = np.full((len(batch_results), top_n), -1, dtype=np.int64)
+    for row, search_results in enumerate(batch_results):
+        ids = [int(result[0]) for result in search_results[:top_n]]
+        retrieved[row, :len(ids)] = ids
+    return retrieved
+
+
+def compute_ranking_metrics(retrieved: np.ndarray, relevant_docs: Sequence[Sequence[int]],
+                            top_n: int) -> Dict[str, float]:
+    """
+    Векторно считает MRR, Precision@k, Recall@k и nDCG@k (бинарная релевантность).
+
+    Args:
+        retrieved: Матрица id документов запрос × ранг (см. results_to_id_matrix).
+        relevant_docs: Релевантные id для каждого запроса.
+        top_n: Глубина k.
+    """
+    retrieved = retrieved[:, :top_n]
+    n_queries = len(relevant_docs)
+    max_relevant = max((len(docs) for docs in relevant_docs), default=0)
+    relevant = np.full((n_queries, max(max_relevant, 1)), -2, dtype=np.int64)
+    for row, docs in enumerate(relevant_docs):
+        relevant[row, :len(docs)] = list(docs)
+    n_relevant = np.array([len(set(docs)) for docs in relevant_docs], dtype=np.float64)
+
+    # hits[q, r] — документ на ранге r релевантен запросу q
+    hits = (retrieved[:, :, None] == relevant[:, None, :]).any(axis=2)
+    ranks = np.arange(1, top_n + 1, dtype=np.float64)
+
+    first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, 0)
+    reciprocal_ranks = np.divide(1.0, first_hit, out=np.zeros(n_queries), where=first_hit > 0)
+
+    hit_counts = hits.sum(axis=1)
+    precision = hit_counts / float(top_n)
+    recall = np.divide(hit_counts, n_relevant, out=np.zeros(n_queries), where=n_relevant > 0)
+
+    discounts = 1.0 / np.log2(ranks + 1.0)
+    dcg = (hits * discounts).sum(axis=1)
+    ideal_counts = np.minimum(n_relevant, top_n).astype(np.int64)
+    ideal_dcg = np.concatenate([[0.0], np.cumsum(discounts)])[ideal_counts]
+    ndcg = np.divide(dcg, ideal_dcg, out=np.zeros(n_queries), where=ideal_dcg > 0)
+
+    return {
+        "MRR": float(reciprocal_ranks.mean()),
+        f"Precision@{top_n}": float(precision.mean()),
+        f"Recall@{top_n}": float(recall.mean()),
+        f"nDCG@{top_n}": float(ndcg.mean()),
     }
 
-    for query, relevant_docs in ground_truth.items():
-        # Передаем и top_n, и все остальные специфичные аргументы
-        search_results = search_engine.search(query, top_n=top_n, **search_kwargs)
-        
-        # ВАЖНО: TF-IDF возвращает (индекс, текст), а Embedding (индекс, текст, скор)
-        # Унифицируем результат
-        if len(search_results[0]) == 3: # Если есть score
-             retrieved_ids = [idx for idx, text, score in search_results]
-        else:
-             retrieved_ids = [idx for idx, text in search_results]
-
-        # Считаем Reciprocal Rank для текущего запроса
-        rank = 0
-        for i, doc_id in enumerate(retrieved_ids, 1):
-            if doc_id in relevant_docs:
-                rank = 1 / i
-                break
-        metrics["mrr"].append(rank)
-
-        # Считаем Precision@5 для текущего запроса
-        hits = len(set(retrieved_ids) & set(relevant_docs))
-        precision = hits / 5.0
-        metrics["precision_at_5"].append(precision)
-
-    # Усредняем метрики по всем запросам
-    avg_mrr = sum(metrics["mrr"]) / len(metrics["mrr"])
-    avg_p5 = sum(metrics["precision_at_5"]) / len(metrics["precision_at_5"])
-    
-    return {"MRR": avg_mrr, "Precision@5": avg_p5}
\ No newline at end of file
+
+def evaluate_search_engine(search_engine, queries, ground_truth, top_n=5, **search_kwargs):
+    """
+    Оценивает качество поиска по разметке ground_truth {запрос: [id релевантных]}.
+    Возвращает MRR, Precision@k, Recall@k и nDCG@k для k = top_n.
+    """
+    query_texts = list(ground_truth.keys())
+    # Если движок умеет искать батчем, прогоняем все запросы одним вызовом
+    if hasattr(search_engine, "search_batch"):
+        batch_results = search_engine.search_batch(query_texts, top_n=top_n, **search_kwargs)
+    else:
+        batch_results = [
+            search_engine.search(query, top_n=top_n, **search_kwargs) for query in query_texts
+        ]
+
+    retrieved = results_to_id_matrix(batch_results, top_n)
+    relevant_docs: List[Sequence[int]] = list(ground_truth.values())
+    return compute_ranking_metrics(retrieved, relevant_docs, top_n)
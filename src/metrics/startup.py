@@ -0,0 +1,79 @@
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Sequence, Tuple
+
+from src import config as cfg
+
+# Модули, которые легкие точки входа не должны импортировать при старте
+HEAVY_MODULES = ("torch", "faiss", "sentence_transformers", "sklearn", "nltk", "yake")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Разбирает вывод python -X importtime.
+
+    Returns:
+        List[Tuple[str, int, int]]: (модуль, собственное время, накопленное время) в микросекундах.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # строка заголовка
+        records.append((name.strip(), int(self_us), int(cumulative_us)))
+    return records
+
+
+def measure_import(module: str, top: int = 10) -> Dict[str, object]:
+    """Импортирует module в чистом интерпретаторе и возвращает время и самые тяжелые импорты."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{completed.stderr[-2000:]}")
+
+    records = parse_importtime(completed.stderr)
+    total_us = sum(self_us for _, self_us, _ in records)
+    imported = {name for name, _, _ in records}
+    heaviest = sorted(records, key=lambda record: record[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "import_seconds": total_us / 1e6,
+        "heavy_modules": sorted(name for name in HEAVY_MODULES if name in imported),
+        "heaviest_imports": [
+            {"module": name, "self_ms": self_us / 1000.0, "cumulative_ms": cumulative_us / 1000.0}
+            for name, self_us, cumulative_us in heaviest
+        ],
+    }
+
+
+def check_startup_budgets(budgets: Dict[str, float] = cfg.STARTUP_IMPORT_BUDGETS,
+                          modules: Sequence[str] = None) -> bool:
+    """
+    Проверяет, что импорт каждой точки входа укладывается в бюджет
+    и не тянет тяжелые зависимости. Возвращает True, если все проверки пройдены.
+    """
+    all_passed = True
+    for module in modules or budgets:
+        budget = budgets[module]
+        result = measure_import(module)
+        passed = result["import_seconds"] <= budget and not result["heavy_modules"]
+        all_passed &= passed
+        print(f"{'OK  ' if passed else 'FAIL'} {module}: {result['import_seconds']:.3f}s "
+              f"(budget {budget:.2f}s)"
+              + (f", heavy imports: {result['heavy_modules']}" if result["heavy_modules"] else ""))
+        if not passed:
+            for record in result["heaviest_imports"][:5]:
+                print(f"       {record['module']}: {record['self_ms']:.1f} ms")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка времени импорта точек входа")
+    parser.add_argument("modules", nargs="*", help="Модули из cfg.STARTUP_IMPORT_BUDGETS (по умолчанию все)")
+    args = parser.parse_args()
+    sys.exit(0 if check_startup_budgets(modules=args.modules) else 1)
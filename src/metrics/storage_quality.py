@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src import config as cfg
+from .benchmark import get_environment_info, save_report
+from .metrics_emb import evaluate_search_engine
+
+# Размеченные запросы из notebooks/8_calculate_metrics.ipynb:
+# i-й запрос описывает i-ю аннотацию датасета df_with_llmkeyphrases
+EVALUATION_QUERIES = (
+    "Как эксперты оценивают надежность техники: использование логики и схем для уменьшения ошибок",
+    "Обряды рождения и свадьбы у народа коми в Сибири и их значение для семейной жизни",
+    "Каким образом западные переселенцы повлияли на экономику южной России в XIX веке",
+    "Развитие методов вероятностного анализа и их применение для расчета надежности систем",
+    "Применение вейвлет-технологий для распознавания степени повреждения нервов по сигналам",
+    "Как индекс тяжести Т-клеточной лимфомы помогает врачу оценивать активность болезни",
+    "Создание системы для контроля качества и автоматизации документов в университете",
+    "История кафедры вычислительной механики ТГУ и вклад академика Яненко",
+    "Математические модели операций по борьбе с пиратством и терроризмом на море",
+    "Как в немецком языке грамматические формы выражают нереальные и будущие действия",
+    "Почему Пушкина связывают с декабристами и какие мифы вокруг этого живут сегодня",
+    "Что показали находки энеолитической керамики лыбаевского типа в Зауралье",
+    "Обзор книги Аллы Николаевской о Сэмюэле Беккете: критический разбор",
+    "Какие изменения происходят в слизистой рта при почечной недостаточности у животных",
+    "Как автоматизировать создание персональных учебных материалов под разные стили обучения",
+)
+
+
+def get_ground_truth() -> Dict[str, List[int]]:
+    """Разметка {запрос: [id релевантной аннотации]} для EVALUATION_QUERIES."""
+    return {query: [doc_id] for doc_id, query in enumerate(EVALUATION_QUERIES)}
+
+
+def evaluate_storage_configs(texts: pd.Series,
+                             configs: Sequence[Tuple[str, str]] = cfg.STORAGE_QUALITY_CONFIGS,
+                             ground_truth: Optional[Dict[str, List[int]]] = None,
+                             top_n: int = cfg.TOP_N_SEARCH,
+                             rerank_candidates: Optional[int] = cfg.STORAGE_QUALITY_RERANK_CANDIDATES,
+                             work_dir: str = cfg.BENCHMARK_WORK_DIR,
+                             output_path: Optional[str] = cfg.STORAGE_QUALITY_OUTPUT_PATH) -> Dict[str, object]:
+    """
+    Строит индекс для каждой пары (index_type, storage_dtype) и считает
+    evaluate_search_engine на размеченных запросах, а также размер индекса
+    и фактический тип embeddings.npy. Индексы строятся во временных
+    директориях, кеш эмбеддингов документов общий, поэтому корпус
+    кодируется один раз. Результат сохраняется в output_path.
+    """
+    from src.search_embeddings.engine import EmbeddingSearchEngine
+
+    ground_truth = ground_truth or get_ground_truth()
+    os.makedirs(work_dir, exist_ok=True)
+    cache_dir = tempfile.mkdtemp(prefix="storage_quality_cache_", dir=work_dir)
+    report = {"environment": get_environment_info(), "rerank_candidates": rerank_candidates, "runs": []}
+    try:
+        for index_type, storage_dtype in configs:
+            run_dir = tempfile.mkdtemp(prefix=f"storage_quality_{index_type}_{storage_dtype}_", dir=work_dir)
+            search_engine = EmbeddingSearchEngine(
+                embedding_path=os.path.join(run_dir, "embeddings.npy"),
+                faiss_index_path=os.path.join(run_dir, "faiss_index.bin"),
+                embedding_cache_path=cache_dir,
+                index_type=index_type,
+                storage_dtype=storage_dtype,
+                rerank_candidates=rerank_candidates,
+            )
+            search_engine.build_index(texts, force_rebuild=True)
+            result = {
+                "index_type": index_type,
+                "storage_dtype": storage_dtype,
+                "metrics": evaluate_search_engine(search_engine, list(ground_truth), ground_truth, top_n=top_n),
+                "storage": search_engine.storage_report(),
+            }
+            report["runs"].append(result)
+            shutil.rmtree(run_dir, ignore_errors=True)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if output_path:
+        save_report(report, output_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Качество поиска на размеченных запросах для разных типов индекса и хранения эмбеддингов"
+    )
+    parser.add_argument("--dataset", default="df_with_llmkeyphrases",
+                        help="Имя parquet-файла в data/ с колонкой abstract")
+    parser.add_argument("--configs", nargs="+", default=None,
+                        help="Пары index_type:storage_dtype, например sq8:float16 "
+                             "(по умолчанию cfg.STORAGE_QUALITY_CONFIGS)")
+    parser.add_argument("--top-n", type=int, default=cfg.TOP_N_SEARCH)
+    parser.add_argument("--rerank-candidates", type=int, default=cfg.STORAGE_QUALITY_RERANK_CANDIDATES)
+    parser.add_argument("--output", default=cfg.STORAGE_QUALITY_OUTPUT_PATH)
+    args = parser.parse_args()
+
+    from src.utils import load_dataset
+    dataset = load_dataset(args.dataset, columns=["abstract"])
+    if dataset is None:
+        sys.exit(1)
+    configs = cfg.STORAGE_QUALITY_CONFIGS
+    if args.configs:
+        configs = []
+        for config in args.configs:
+            index_type, _, storage_dtype = config.partition(":")
+            configs.append((index_type, storage_dtype or cfg.EMBEDDING_STORAGE_DTYPE))
+    evaluate_storage_configs(dataset["abstract"], configs=configs, top_n=args.top_n,
+                             rerank_candidates=args.rerank_candidates, output_path=args.output)
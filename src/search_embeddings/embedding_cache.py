@@ -0,0 +1,152 @@
+import os
+import glob
+from typing import Iterable, List
+
+import numpy as np
+import xxhash
+
+
+class EmbeddingCache:
+    """
+    Персистентный кеш эмбеддингов с адресацией по содержимому.
+    Ключ — xxhash от (описание кодировщика, префикс, текст), поэтому при
+    изменении корпуса заново кодируются только новые или измененные тексты,
+    а векторы другой модели или бэкенда кодировщика не переиспользуются.
+
+    Кеш хранится в директории как набор append-only шардов: каждое
+    добавление пишет новую пару shard_NNNNN.embeddings.npy/.keys.npy и
+    не трогает старые файлы. В памяти держится только отсортированный
+    индекс ключей (8 байт на вектор плюс номер строки), сами векторы
+    читаются из шардов через memory map.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._shard_offsets: List[int] = [0]
+        self._shards: List[str] = []
+        self._shard_embeddings: List[np.ndarray] = []
+        self._next_shard = 0
+        self._load()
+
+    @staticmethod
+    def make_key(encoder_signature: str, prefix: str, text: str) -> int:
+        """Считает ключ кеша для одного текста."""
+        return xxhash.xxh3_64_intdigest(f"{encoder_signature}\x00{prefix}\x00{text}".encode("utf-8"))
+
+    @classmethod
+    def make_keys(cls, encoder_signature: str, prefix: str, texts: Iterable[str]) -> np.ndarray:
+        """Считает ключи кеша для корпуса текстов."""
+        return np.array(
+            [cls.make_key(encoder_signature, prefix, str(text)) for text in texts],
+            dtype=np.uint64
+        )
+
+    def __len__(self) -> int:
+        return len(self._sorted_keys)
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """Позиции ключей в отсортированном индексе (для отсутствующих — произвольные)."""
+        positions = np.searchsorted(self._sorted_keys, keys)
+        return np.minimum(positions, max(len(self._sorted_keys) - 1, 0))
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Возвращает булеву маску ключей, уже присутствующих в кеше."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if len(self._sorted_keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        return self._sorted_keys[self._find(keys)] == keys
+
+    def get(self, keys: np.ndarray) -> np.ndarray:
+        """Возвращает эмбеддинги для ключей в том же порядке."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if not self.contains(keys).all():
+            raise KeyError("Some keys are missing from the embedding cache.")
+        rows = self._sorted_rows[self._find(keys)]
+        shard_ids = np.searchsorted(self._shard_offsets, rows, side="right") - 1
+
+        dimension = self._get_shard(0).shape[1] if self._shards else 0
+        embeddings = np.empty((len(keys), dimension), dtype=np.float32)
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            local_rows = rows[positions] - self._shard_offsets[shard_id]
+            # Чтение отсортированных строк из memory map идет последовательнее
+            unique_rows, inverse = np.unique(local_rows, return_inverse=True)
+            embeddings[positions] = self._get_shard(shard_id)[unique_rows][inverse]
+        return embeddings
+
+    def add(self, keys: np.ndarray, embeddings: np.ndarray):
+        """
+        Добавляет новые эмбеддинги в кеш (уже известные ключи пропускаются).
+        Новые векторы сразу записываются отдельным шардом, поэтому стоимость
+        добавления зависит только от его размера, а не от размера кеша.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        new_mask = ~self.contains(keys)
+        if not new_mask.any():
+            return
+
+        new_keys = np.asarray(keys, dtype=np.uint64)[new_mask]
+        # Внутри одного добавления ключи тоже могут повторяться
+        new_keys, first_positions = np.unique(new_keys, return_index=True)
+        new_embeddings = embeddings[new_mask][first_positions]
+
+        shard_path = os.path.join(self.cache_path, f"shard_{self._next_shard:05d}")
+        os.makedirs(self.cache_path, exist_ok=True)
+        # Файл ключей пишется последним: шард без него при загрузке не виден
+        self._write_atomic(shard_path + ".embeddings.npy", new_embeddings)
+        self._write_atomic(shard_path + ".keys.npy", new_keys)
+        self._next_shard += 1
+
+        rows = self._register_shard(shard_path, len(new_keys))
+        positions = np.searchsorted(self._sorted_keys, new_keys)
+        self._sorted_keys = np.insert(self._sorted_keys, positions, new_keys)
+        self._sorted_rows = np.insert(self._sorted_rows, positions, rows)
+
+    @staticmethod
+    def _write_atomic(path: str, array: np.ndarray):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def _register_shard(self, shard_path: str, num_rows: int) -> np.ndarray:
+        """Регистрирует шард и возвращает сквозные номера его строк."""
+        offset = self._shard_offsets[-1]
+        self._shards.append(shard_path)
+        self._shard_embeddings.append(None)
+        self._shard_offsets.append(offset + num_rows)
+        return np.arange(offset, offset + num_rows, dtype=np.int64)
+
+    def _get_shard(self, shard_id: int) -> np.ndarray:
+        """Открывает векторы шарда через memory map при первом обращении."""
+        if self._shard_embeddings[shard_id] is None:
+            self._shard_embeddings[shard_id] = np.load(
+                self._shards[shard_id] + ".embeddings.npy", mmap_mode="r"
+            )
+        return self._shard_embeddings[shard_id]
+
+    def _load(self):
+        """Читает ключи всех записанных шардов, если кеш существует."""
+        all_keys, all_rows = [], []
+        for keys_path in sorted(glob.glob(os.path.join(self.cache_path, "shard_*.keys.npy"))):
+            shard_path = keys_path[:-len(".keys.npy")]
+            if not os.path.exists(shard_path + ".embeddings.npy"):
+                continue
+            shard_keys = np.load(keys_path)
+            all_keys.append(shard_keys)
+            all_rows.append(self._register_shard(shard_path, len(shard_keys)))
+        # Номер следующего шарда больше номеров всех файлов, включая недописанные
+        for path in glob.glob(os.path.join(self.cache_path, "shard_*")):
+            number = os.path.basename(path)[len("shard_"):].split(".", 1)[0]
+            if number.isdigit():
+                self._next_shard = max(self._next_shard, int(number) + 1)
+
+        if all_keys:
+            keys, rows = np.concatenate(all_keys), np.concatenate(all_rows)
+            order = np.argsort(keys, kind="stable")
+            self._sorted_keys, self._sorted_rows = keys[order], rows[order]
+        if self._shards:
+            print(f"Loaded embedding cache index from {self.cache_path}. "
+                  f"Contains {len(self)} embeddings in {len(self._shards)} shards.")
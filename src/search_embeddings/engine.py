@@ -1,19 +1,41 @@
 
 import os
+import glob
+import json
 import time
-from typing import List, Tuple
+import shutil
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Set, Tuple
 
-import torch
-import faiss
+import xxhash
 import numpy as np
 import pandas as pd
 from src import config as cfg
-from sentence_transformers import SentenceTransformer
+from src.lazy_import import lazy_import
+from src.instrumentation import observe_stage, stage_timer
+from .embedding_cache import EmbeddingCache
+from .query_cache import LRUCache
+from .text_store import ArrowTextStore
+
+# Тяжелые зависимости импортируются при первом использовании движка
+torch = lazy_import("torch")
+faiss = lazy_import("faiss")
+sentence_transformers = lazy_import("sentence_transformers")
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 DEFAULT_MODEL_NAME = cfg.DEFAULT_MODEL_NAME
 DEFAULT_EMBEDDING_PATH = cfg.DEFAULT_EMBEDDING_PATH
 DEFAULT_FAISS_INDEX_PATH = cfg.DEFAULT_FAISS_INDEX_PATH
 DEFAULT_BATCH_SIZE = cfg.DEFAULT_BATCH_SIZE
+DEFAULT_EMBEDDING_CACHE_PATH = cfg.DEFAULT_EMBEDDING_CACHE_PATH
+
+DOCUMENT_PREFIX = "search_document: "
+QUERY_PREFIX = "search_query: "
+
+SUPPORTED_INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "sq_fp16")
+SUPPORTED_STORAGE_DTYPES = ("float32", "float16")
+SUPPORTED_ENCODER_BACKENDS = ("torch", "torch_int8", "onnx")
 
 class EmbeddingSearchEngine:
     """
@@ -23,18 +45,182 @@ class EmbeddingSearchEngine:
     def __init__(self,
                  model_name: str = DEFAULT_MODEL_NAME,
                  embedding_path: str = DEFAULT_EMBEDDING_PATH,
-                 faiss_index_path: str = DEFAULT_FAISS_INDEX_PATH):
-        """Инициализация движка."""
+                 faiss_index_path: str = DEFAULT_FAISS_INDEX_PATH,
+                 index_type: str = cfg.FAISS_INDEX_TYPE,
+                 embedding_cache_path: str = DEFAULT_EMBEDDING_CACHE_PATH,
+                 use_mmap: bool = cfg.FAISS_USE_MMAP,
+                 query_cache_size: int = cfg.QUERY_EMBEDDING_CACHE_SIZE,
+                 query_cache_ttl: Optional[float] = cfg.QUERY_EMBEDDING_CACHE_TTL,
+                 result_cache_size: int = cfg.SEARCH_RESULT_CACHE_SIZE,
+                 warmup: bool = cfg.ENCODER_WARMUP,
+                 encoder_backend: str = cfg.ENCODER_BACKEND,
+                 num_threads: Optional[int] = cfg.ENCODER_NUM_THREADS,
+                 max_seq_length: Optional[int] = cfg.ENCODER_MAX_SEQ_LENGTH,
+                 storage_dtype: str = cfg.EMBEDDING_STORAGE_DTYPE,
+                 rerank_candidates: Optional[int] = cfg.FAISS_RERANK_CANDIDATES):
+        """
+        Инициализация движка.
+
+        query_cache_size/query_cache_ttl задают LRU-кеш нормированных
+        эмбеддингов запросов, result_cache_size — кеш top-k результатов,
+        который сбрасывается при любом изменении индекса.
+        encoder_backend выбирает реализацию кодировщика: "torch" (fp32),
+        "torch_int8" или "onnx"; последние два работают только на CPU.
+        storage_dtype задает точность embeddings.npy на диске, а
+        rerank_candidates — сколько кандидатов из (сжатого) индекса
+        переранжировать точно по этим векторам.
+        """
+        if index_type not in SUPPORTED_INDEX_TYPES:
+            raise ValueError(
+                f"Unknown index_type '{index_type}'. Expected one of {SUPPORTED_INDEX_TYPES}."
+            )
+        if encoder_backend not in SUPPORTED_ENCODER_BACKENDS:
+            raise ValueError(
+                f"Unknown encoder_backend '{encoder_backend}'. Expected one of {SUPPORTED_ENCODER_BACKENDS}."
+            )
+        if storage_dtype not in SUPPORTED_STORAGE_DTYPES:
+            raise ValueError(
+                f"Unknown storage_dtype '{storage_dtype}'. Expected one of {SUPPORTED_STORAGE_DTYPES}."
+            )
+        self.model_name = model_name
         self.embedding_path = embedding_path
         self.faiss_index_path = faiss_index_path
-        self.device = self._get_optimal_device()
+        self.index_type = index_type
+        self.use_mmap = use_mmap
+        self.nprobe = cfg.FAISS_IVF_NPROBE
+        self.ef_search = cfg.FAISS_HNSW_EF_SEARCH
+        self.encoder_backend = encoder_backend
+        self.num_threads = num_threads
+        self.max_seq_length = max_seq_length
+        self.storage_dtype = storage_dtype
+        self.rerank_candidates = rerank_candidates
+        self.device = self._get_optimal_device() if encoder_backend == "torch" else "cpu"
+        if num_threads:
+            torch.set_num_threads(num_threads)
         
-        print(f"Loading sentence transformer model: {model_name}...")
-        self.model = SentenceTransformer(model_name, device=self.device)
+        print(f"Loading sentence transformer model: {model_name} (backend '{encoder_backend}')...")
+        self.model = self._load_model(encoder_backend)
         print(f"Model {model_name} loaded successfully on device '{self.device}'.")
 
+        self.delta_path = faiss_index_path + ".delta"
+        self.legacy_delta_path = faiss_index_path + ".delta.npz"
+        self.manifest_path = faiss_index_path + ".manifest.json"
+        self.texts_path = faiss_index_path + ".texts.arrow"
+        self.embedding_cache_path = embedding_cache_path
+        # Кеш эмбеддингов документов нужен только при построении и
+        # дополнении индекса, поэтому открывается при первом обращении
+        self._embedding_cache: Optional[EmbeddingCache] = None
+
         self.index: faiss.Index = None
-        self.original_texts: List[str] = None
+        # Добавленные документы живут в отдельном небольшом индексе в RAM
+        # с id от base_size, а базовый индекс (в том числе отображенный
+        # в память) после построения не изменяется
+        self.delta_index: faiss.Index = None
+        self.original_texts: Sequence[str] = None
+        self.base_size: int = 0
+        self.deleted_ids: Set[int] = set()
+        self._next_delta_shard = 0
+        self._rerank_base: np.ndarray = None
+        self._rerank_delta: np.ndarray = None
+        self._search_params: Optional[Tuple["faiss.SearchParameters", "faiss.SearchParameters"]] = None
+        self._deleted_selector = None
+
+        self.query_cache = LRUCache(query_cache_size, query_cache_ttl)
+        self.result_cache = LRUCache(result_cache_size)
+
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """
+        Прогоняет тестовый запрос через модель (и индекс, если он загружен),
+        чтобы ленивая инициализация не попадала в latency первого запроса.
+        Кеши при этом не заполняются.
+        """
+        start_time = time.time()
+        query_embedding = self._encode_uncached([QUERY_PREFIX + "warmup"])
+        if self.index is not None and self.index.ntotal > 0:
+            self.index.search(query_embedding, 1)
+        print(f"Encoder warmed up in {time.time() - start_time:.2f} seconds.")
+
+    def cache_stats(self) -> dict:
+        """Статистика попаданий в кеши запросов и результатов."""
+        return {
+            "query_embeddings": self.query_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+
+    def _invalidate_result_cache(self):
+        """
+        Сбрасывает кеш результатов и параметры поиска с селектором удаленных
+        документов после изменения индекса или параметров поиска.
+        """
+        self.result_cache.clear()
+        self._search_params = None
+        self._deleted_selector = None
+
+    def _load_model(self, encoder_backend: str) -> "SentenceTransformer":
+        """Загружает модель с выбранным бэкендом кодировщика."""
+        if encoder_backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            if cfg.ENCODER_ONNX_FILE_NAME:
+                model_kwargs["file_name"] = cfg.ENCODER_ONNX_FILE_NAME
+            if self.num_threads:
+                try:
+                    import onnxruntime
+                except ImportError as e:
+                    raise ImportError(
+                        "encoder_backend='onnx' requires optimum[onnxruntime]."
+                    ) from e
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = self.num_threads
+                model_kwargs["session_options"] = session_options
+            model = sentence_transformers.SentenceTransformer(
+                self.model_name, device=self.device, backend="onnx", model_kwargs=model_kwargs
+            )
+        else:
+            model = sentence_transformers.SentenceTransformer(self.model_name, device=self.device)
+            if encoder_backend == "torch_int8":
+                # Веса Linear-слоев хранятся в int8, активации квантуются на лету
+                torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+
+        if self.max_seq_length:
+            model.max_seq_length = self.max_seq_length
+        return model
+
+    def compare_with_fp32(self, texts: Sequence[str], sample_size: int = 200) -> dict:
+        """
+        Сравнивает векторы текущего кодировщика с эталонной fp32-моделью
+        на выборке документов. Возвращает среднее и минимальное
+        косинусное сходство между парами векторов.
+        """
+        rng = np.random.default_rng(42)
+        sample_ids = rng.choice(len(texts), size=min(sample_size, len(texts)), replace=False)
+        sample = [str(texts[i]) for i in np.sort(sample_ids)]
+
+        print(f"Loading fp32 reference model {self.model_name} on CPU...")
+        reference_model = sentence_transformers.SentenceTransformer(self.model_name, device="cpu")
+        if self.max_seq_length:
+            reference_model.max_seq_length = self.max_seq_length
+        prefixed = [DOCUMENT_PREFIX + text for text in sample]
+        reference = reference_model.encode(prefixed, batch_size=DEFAULT_BATCH_SIZE,
+                                           convert_to_numpy=True).astype(np.float32)
+        candidate = np.array(self._encode_documents(sample), dtype=np.float32)
+
+        faiss.normalize_L2(reference)
+        faiss.normalize_L2(candidate)
+        cosines = (reference * candidate).sum(axis=1)
+        report = {
+            "encoder_backend": self.encoder_backend,
+            "num_samples": len(sample),
+            "mean_cosine": float(cosines.mean()),
+            "min_cosine": float(cosines.min()),
+        }
+        print(f"Encoder '{self.encoder_backend}' vs fp32: mean cosine {report['mean_cosine']:.4f}, "
+              f"min cosine {report['min_cosine']:.4f} on {len(sample)} documents.")
+        return report
 
     def _get_optimal_device(self) -> str:
         """Определяет наилучшее доступное устройство."""
@@ -47,82 +233,735 @@ class EmbeddingSearchEngine:
     def build_index(self, texts: pd.Series, force_rebuild: bool = False):
         """
         Создает векторный индекс FAISS.
-        Если кэшированные файлы существуют, загружает их.
+        Если сохраненный индекс построен по тому же корпусу (проверяется
+        по манифесту), загружает его. Иначе берет эмбеддинги из кеша
+        и кодирует только отсутствующие в нем тексты.
         """
-        self.original_texts = texts.tolist()
+        keys = EmbeddingCache.make_keys(self._encoder_signature(), DOCUMENT_PREFIX, texts)
+        manifest = self._make_manifest(keys)
 
         if os.path.exists(self.faiss_index_path) and not force_rebuild:
-            print(f"Loading pre-built FAISS index from {self.faiss_index_path}...")
-            self.index = faiss.read_index(self.faiss_index_path)
-            print(f"FAISS index loaded. Contains {self.index.ntotal} vectors.")
-            return
-
-        if os.path.exists(self.embedding_path) and not force_rebuild:
-            print(f"Loading pre-computed embeddings from {self.embedding_path}...")
-            embeddings = np.load(self.embedding_path)
-        else:
-            print("Building embeddings from scratch...")
-            start_time = time.time()
-            documents_with_prefix = ["search_document: " + str(text) for text in texts]
-            embeddings = self.model.encode(
-                documents_with_prefix,
-                show_progress_bar=True,
-                batch_size=DEFAULT_BATCH_SIZE,
-                convert_to_numpy=True,
-                device=self.device
-            )
-            end_time = time.time()
-            print(f"Embeddings built in {end_time - start_time:.2f} seconds.")
-            print(f"Saving embeddings to {self.embedding_path}...")
-            os.makedirs(os.path.dirname(self.embedding_path), exist_ok=True)
-            np.save(self.embedding_path, embeddings)
+            if self._is_manifest_valid(manifest):
+                if not os.path.exists(self.texts_path):
+                    ArrowTextStore.write(self.texts_path, texts)
+                self.load_index()
+                return
+            print("Pre-built FAISS index is stale, rebuilding it...")
 
-        print("Building FAISS index...")
+        self.original_texts = texts.tolist()
         start_time = time.time()
+        embeddings = self._get_document_embeddings(self.original_texts, keys)
+        end_time = time.time()
+        print(f"Embeddings ready in {end_time - start_time:.2f} seconds.")
+        print(f"Saving embeddings to {self.embedding_path}...")
+        os.makedirs(os.path.dirname(self.embedding_path), exist_ok=True)
+        np.save(self.embedding_path, np.asarray(embeddings, dtype=self.storage_dtype))
+
+        print(f"Building FAISS index (type '{self.index_type}')...")
+        start_time = time.perf_counter()
         
-        d = embeddings.shape[1]
-        
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
         faiss.normalize_L2(embeddings)
         
-        self.index = faiss.IndexFlatIP(d)
+        self.index = self._create_index(embeddings)
         
         self.index.add(embeddings)
+        self.set_search_params()
         
-        end_time = time.time()
-        print(f"FAISS index built in {end_time - start_time:.2f} seconds. Contains {self.index.ntotal} vectors.")
+        elapsed = time.perf_counter() - start_time
+        observe_stage("embeddings", "build_index", elapsed, items=self.index.ntotal)
+        print(f"FAISS index built in {elapsed:.2f} seconds. Contains {self.index.ntotal} vectors.")
 
         print(f"Saving FAISS index to {self.faiss_index_path}...")
         faiss.write_index(self.index, self.faiss_index_path)
+        ArrowTextStore.write(self.texts_path, self.original_texts)
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
         print("FAISS index saved successfully.")
 
-    def search(self, query: str, top_n: int = 5) -> List[Tuple[int, str, float]]:
+        # Новый базовый индекс уже содержит весь корпус, старая дельта неактуальна
+        self.base_size = self.index.ntotal
+        self._clear_delta()
+        self._reset_rerank_vectors()
+        self._invalidate_result_cache()
+
+    def load_index(self):
         """
-        Выполняет семантический поиск с использованием FAISS.
+        Загружает сохраненный индекс, тексты и дельту без проверки корпуса.
+        При use_mmap индекс и тексты отображаются в память, поэтому запуск
+        почти мгновенный, а данные разделяются между процессами.
+        """
+        for path in (self.faiss_index_path, self.texts_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found. Call build_index() first.")
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.index_type = json.load(f).get("index_type", self.index_type)
+
+        print(f"Loading pre-built FAISS index from {self.faiss_index_path}"
+              + (" (memory-mapped)..." if self.use_mmap else "..."))
+        self._read_base_index()
+        self.original_texts = ArrowTextStore.open(self.texts_path)
+        self.base_size = self.index.ntotal
+        self._load_delta()
+        self._reset_rerank_vectors()
+        self._invalidate_result_cache()
+        print(f"FAISS index loaded. Contains {self._num_vectors()} vectors.")
+
+    def _read_base_index(self, use_mmap: bool = None):
+        """Читает базовый индекс с диска, при необходимости через memory map."""
+        use_mmap = self.use_mmap if use_mmap is None else use_mmap
+        if use_mmap:
+            self.index = faiss.read_index(self.faiss_index_path, self._mmap_flags())
+        else:
+            self.index = faiss.read_index(self.faiss_index_path)
+        self.set_search_params()
+
+    def _mmap_flags(self) -> int:
+        """Флаги чтения FAISS для отображения индекса в память без копирования."""
+        if self.index_type.startswith("ivf"):
+            # Инвертированные списки IVF отображаются через OnDiskInvertedLists
+            return faiss.IO_FLAG_MMAP
+        # Векторы flat/HNSW (IndexFlatCodes) читаются как view на файл
+        return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+    def _new_delta_index(self) -> "faiss.Index":
+        """
+        Пустой индекс добавленных документов: точный поиск с той же
+        метрикой, что и у базового индекса, и сквозными id документов.
+        """
+        return faiss.IndexIDMap(faiss.IndexFlat(self.index.d, self.index.metric_type))
+
+    def _num_vectors(self) -> int:
+        """Число документов в базовом индексе и дельте (включая удаленные)."""
+        return self.base_size + (self.delta_index.ntotal if self.delta_index is not None else 0)
+
+    def _encoder_params(self) -> dict:
+        """
+        Параметры кодировщика, от которых зависят векторы документов:
+        бэкенд, файл ONNX и максимальная длина последовательности.
+        """
+        return {
+            "encoder_backend": self.encoder_backend,
+            "onnx_file_name": (cfg.ENCODER_ONNX_FILE_NAME or "model.onnx") if self.encoder_backend == "onnx" else None,
+            "max_seq_length": getattr(self.model, "max_seq_length", self.max_seq_length),
+        }
+
+    def _encoder_signature(self) -> str:
+        """
+        Описание кодировщика для ключей кеша эмбеддингов, чтобы векторы
+        разных бэкендов и длин не подменяли друг друга.
+        """
+        return "\x00".join(str(value) for value in [self.model_name, *self._encoder_params().values()])
+
+    def _make_manifest(self, keys: np.ndarray) -> dict:
+        """Описывает корпус и параметры, по которым строится индекс."""
+        return {
+            "model_name": self.model_name,
+            **self._encoder_params(),
+            "document_prefix": DOCUMENT_PREFIX,
+            "index_type": self.index_type,
+            "storage_dtype": self.storage_dtype,
+            "num_documents": int(len(keys)),
+            "corpus_hash": xxhash.xxh3_64_hexdigest(keys.tobytes()),
+        }
+
+    def _is_manifest_valid(self, manifest: dict) -> bool:
+        """Проверяет, что сохраненный индекс построен по тому же корпусу и модели."""
+        if not os.path.exists(self.manifest_path):
+            print(f"Manifest {self.manifest_path} not found.")
+            return False
+        with open(self.manifest_path, encoding="utf-8") as f:
+            stored_manifest = json.load(f)
+        mismatched = [key for key, value in manifest.items() if stored_manifest.get(key) != value]
+        if mismatched:
+            print(f"Manifest mismatch in fields: {mismatched}.")
+            return False
+        return True
+
+    def _get_embedding_cache(self) -> EmbeddingCache:
+        """Открывает кеш эмбеддингов документов при первом обращении."""
+        if self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache(self.embedding_cache_path)
+        return self._embedding_cache
+
+    def _encode_missing(self, texts: List[str], keys: np.ndarray):
+        """Кодирует и добавляет в кеш только тексты, которых в нем еще нет."""
+        embedding_cache = self._get_embedding_cache()
+        missing_mask = ~embedding_cache.contains(keys)
+        missing_keys, missing_positions = np.unique(keys[missing_mask], return_index=True)
+        if len(missing_keys):
+            missing_texts = [texts[i] for i in np.flatnonzero(missing_mask)[missing_positions]]
+            print(f"Encoding {len(missing_texts)} of {len(texts)} documents "
+                  f"({len(texts) - int(missing_mask.sum())} found in cache)...")
+            embedding_cache.add(missing_keys, self._encode_documents(missing_texts))
+        else:
+            print(f"All {len(texts)} document embeddings found in cache.")
+
+    def _get_document_embeddings(self, texts: List[str], keys: np.ndarray) -> np.ndarray:
+        """
+        Возвращает эмбеддинги документов, кодируя только тексты,
+        которых еще нет в кеше.
+        """
+        self._encode_missing(texts, keys)
+        return self._get_embedding_cache().get(keys)
+
+    def build_index_from_batches(self, batches: Iterable[Iterable[str]], force_rebuild: bool = False):
+        """
+        Строит индекс по потоку батчей текстов, например по очищенным
+        батчам corpus_loader.iter_clean_batches:
+
+            engine.build_index_from_batches(
+                batch.column("abstract").to_pylist() for batch in iter_clean_batches(path)
+            )
+
+        Каждый батч кодируется сразу после чтения и пишется шардом в кеш
+        эмбеддингов, поэтому корпус не собирается в DataFrame, а прерванное
+        построение продолжается с уже закодированных батчей. Затем индекс
+        строится обычным build_index по векторам из кеша.
+        """
+        texts = []
+        for batch in batches:
+            batch_texts = [str(text) for text in batch]
+            keys = EmbeddingCache.make_keys(self._encoder_signature(), DOCUMENT_PREFIX, batch_texts)
+            self._encode_missing(batch_texts, keys)
+            texts.extend(batch_texts)
+        self.build_index(pd.Series(texts, dtype=object), force_rebuild=force_rebuild)
+
+    def _encode_documents(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        Кодирует документы с префиксом search_document.
+        Документы сортируются по длине, чтобы в батч попадали тексты
+        близкой длины и на паддинг уходило меньше вычислений;
+        порядок векторов затем восстанавливается.
+        """
+        documents_with_prefix = [DOCUMENT_PREFIX + str(text) for text in texts]
+        if not documents_with_prefix:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort([len(text) for text in documents_with_prefix], kind="stable")
+
+        start_time = time.perf_counter()
+        sorted_embeddings = self.model.encode(
+            [documents_with_prefix[i] for i in order],
+            show_progress_bar=True,
+            batch_size=DEFAULT_BATCH_SIZE,
+            convert_to_numpy=True,
+            device=self.device
+        )
+        elapsed = time.perf_counter() - start_time
+        observe_stage("embeddings", "encode_documents", elapsed, items=len(documents_with_prefix))
+        print(f"Encoded {len(documents_with_prefix)} documents in {elapsed:.2f} seconds "
+              f"({len(documents_with_prefix) / max(elapsed, 1e-9):.1f} docs/sec, "
+              f"backend '{self.encoder_backend}').")
+
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings
+
+    def add_documents(self, texts: Iterable[str]) -> List[int]:
+        """
+        Добавляет новые документы в индекс без его перестроения.
+        Кодируются только новые тексты; им выдаются последовательные id,
+        совпадающие с позицией в original_texts. Изменения сохраняются в дельту.
         """
         if self.index is None:
             raise RuntimeError("Index has not been built. Call build_index() first.")
 
+        new_texts = [str(text) for text in texts]
+        if not new_texts:
+            return []
+
         start_time = time.time()
-        
-        query_with_prefix = "search_query: " + query
-        query_embedding = self.model.encode(
-            query_with_prefix,
-            convert_to_numpy=True
-        ).reshape(1, -1)
-        
-        faiss.normalize_L2(query_embedding)
+        keys = EmbeddingCache.make_keys(self._encoder_signature(), DOCUMENT_PREFIX, new_texts)
+        embeddings = np.array(self._get_document_embeddings(new_texts, keys), dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+
+        # Базовый индекс не трогаем: векторы попадают в индекс дельты в RAM
+        first_id = self._num_vectors()
+        new_ids = list(range(first_id, first_id + len(new_texts)))
+        self.delta_index.add_with_ids(embeddings, np.array(new_ids, dtype=np.int64))
+        self.original_texts.extend(new_texts)
+
+        self._write_delta_shard(embeddings, new_texts)
+        self._rerank_delta = None
+        self._invalidate_result_cache()
 
-        distances, indices = self.index.search(query_embedding, top_n)
-        
         end_time = time.time()
-        print(f"FAISS search completed in {end_time - start_time:.4f} seconds.")
-
-        results = []
-        for i in range(top_n):
-            doc_index = indices[0][i]
-            similarity_score = round(distances[0][i], 4)
-            if doc_index != -1:
-                doc_text = self.original_texts[doc_index]
-                results.append((doc_index, doc_text, similarity_score))
-            
-        return results
\ No newline at end of file
+        print(f"Added {len(new_texts)} documents in {end_time - start_time:.2f} seconds. "
+              f"Index contains {self._num_vectors()} vectors.")
+        return new_ids
+
+    def remove_documents(self, doc_ids: Iterable[int]):
+        """
+        Помечает документы как удаленные (tombstone).
+        Векторы остаются в индексе, но исключаются из результатов поиска.
+        """
+        if self.index is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+
+        ids = {int(doc_id) for doc_id in doc_ids}
+        invalid_ids = [doc_id for doc_id in ids if not 0 <= doc_id < self._num_vectors()]
+        if invalid_ids:
+            raise ValueError(f"Unknown document ids: {sorted(invalid_ids)}")
+
+        self.deleted_ids.update(ids)
+        self._save_tombstones()
+        self._invalidate_result_cache()
+        print(f"Removed {len(ids)} documents. {len(self.deleted_ids)} documents are tombstoned.")
+
+    def _write_delta_shard(self, embeddings: np.ndarray, texts: List[str]):
+        """
+        Дописывает векторы и тексты добавленных документов новым шардом
+        дельты shard_NNNNN.npz. Старые шарды не перезаписываются, поэтому
+        стоимость добавления зависит только от его размера.
+        """
+        text_offsets, text_data = ArrowTextStore.encode_offsets(texts)
+        os.makedirs(self.delta_path, exist_ok=True)
+        shard_path = os.path.join(self.delta_path, f"shard_{self._next_delta_shard:05d}.npz")
+        self._write_npz_atomic(
+            shard_path,
+            base_size=np.int64(self.base_size),
+            embeddings=embeddings,
+            text_offsets=text_offsets,
+            text_data=text_data,
+        )
+        self._next_delta_shard += 1
+
+    def _save_tombstones(self):
+        """Перезаписывает небольшой файл со списком удаленных id."""
+        os.makedirs(self.delta_path, exist_ok=True)
+        self._write_npz_atomic(
+            os.path.join(self.delta_path, "deleted_ids.npz"),
+            base_size=np.int64(self.base_size),
+            deleted_ids=np.array(sorted(self.deleted_ids), dtype=np.int64),
+        )
+
+    @staticmethod
+    def _write_npz_atomic(path: str, **arrays: np.ndarray):
+        # Запись во временный файл и os.replace: сбой посреди записи
+        # не оставит поврежденный файл дельты
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def _clear_delta(self):
+        """Удаляет дельту с диска и создает пустой индекс добавленных документов."""
+        self.delta_index = self._new_delta_index()
+        self.deleted_ids = set()
+        self._next_delta_shard = 0
+        if os.path.isdir(self.delta_path):
+            shutil.rmtree(self.delta_path)
+        if os.path.exists(self.legacy_delta_path):
+            os.remove(self.legacy_delta_path)
+
+    def _delta_shard_paths(self) -> List[Tuple[int, str]]:
+        """Номера и пути записанных шардов дельты в порядке добавления."""
+        shards = []
+        for path in glob.glob(os.path.join(self.delta_path, "shard_*.npz")):
+            number = os.path.basename(path)[len("shard_"):-len(".npz")]
+            if number.isdigit():
+                shards.append((int(number), path))
+        return sorted(shards)
+
+    def _migrate_legacy_delta(self):
+        """Переписывает дельту старого формата (один файл .delta.npz) в шарды."""
+        with np.load(self.legacy_delta_path, allow_pickle=False) as delta:
+            base_size = int(delta["base_size"])
+            embeddings = delta["embeddings"]
+            if "text_offsets" in delta.files:
+                added_texts = ArrowTextStore.decode_offsets(delta["text_offsets"], delta["text_data"])
+            else:
+                added_texts = delta["texts"].tolist()  # формат до кодирования смещениями
+            deleted_ids = delta["deleted_ids"].tolist()
+
+        if base_size == self.base_size and not os.path.isdir(self.delta_path):
+            print(f"Converting delta {self.legacy_delta_path} into shards at {self.delta_path}...")
+            if len(embeddings):
+                self._write_delta_shard(embeddings, added_texts)
+            if deleted_ids:
+                self.deleted_ids = set(deleted_ids)
+                self._save_tombstones()
+        os.remove(self.legacy_delta_path)
+
+    def _load_delta(self):
+        """
+        Читает шарды дельты в индекс добавленных документов и список
+        удаленных id. Дельта от другого базового индекса удаляется.
+        """
+        self.delta_index = self._new_delta_index()
+        self.deleted_ids = set()
+        self._next_delta_shard = 0
+        if os.path.exists(self.legacy_delta_path):
+            self._migrate_legacy_delta()
+            self.deleted_ids = set()
+        if not os.path.isdir(self.delta_path):
+            return
+
+        shards = self._delta_shard_paths()
+        tombstones_path = os.path.join(self.delta_path, "deleted_ids.npz")
+        delta_files = [path for _, path in shards]
+        if os.path.exists(tombstones_path):
+            delta_files.append(tombstones_path)
+
+        added_embeddings, added_texts, deleted_ids = [], [], []
+        for path in delta_files:
+            with np.load(path, allow_pickle=False) as delta:
+                if int(delta["base_size"]) != self.base_size:
+                    print(f"Delta at {self.delta_path} does not match the base index, removing it.")
+                    self._clear_delta()
+                    return
+                if "embeddings" in delta.files:
+                    added_embeddings.append(delta["embeddings"])
+                    added_texts.extend(ArrowTextStore.decode_offsets(delta["text_offsets"], delta["text_data"]))
+                else:
+                    deleted_ids = delta["deleted_ids"].tolist()
+        if shards:
+            self._next_delta_shard = shards[-1][0] + 1
+
+        if added_embeddings:
+            embeddings = np.ascontiguousarray(np.vstack(added_embeddings), dtype=np.float32)
+            ids = np.arange(self.base_size, self.base_size + len(embeddings), dtype=np.int64)
+            self.delta_index.add_with_ids(embeddings, ids)
+            self.original_texts.extend(added_texts)
+        self.deleted_ids = set(deleted_ids)
+        print(f"Applied delta: {len(added_texts)} added in {len(shards)} shards, "
+              f"{len(self.deleted_ids)} removed documents.")
+
+    def _delta_embeddings(self) -> np.ndarray:
+        """Векторы добавленных документов из индекса дельты (строка i — id base_size + i)."""
+        flat_index = faiss.downcast_index(self.delta_index.index)
+        if flat_index.ntotal == 0:
+            return np.empty((0, self.index.d), dtype=np.float32)
+        return flat_index.reconstruct_n(0, flat_index.ntotal)
+
+    def _create_index(self, embeddings: np.ndarray) -> "faiss.Index":
+        """
+        Создает индекс FAISS заданного типа и, если нужно, обучает его
+        на случайной выборке векторов.
+        """
+        n, d = embeddings.shape
+
+        if self.index_type == "flat":
+            return faiss.IndexFlatIP(d)
+
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(d, cfg.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = cfg.FAISS_HNSW_EF_CONSTRUCTION
+            return index
+
+        if self.index_type in ("sq8", "sq_fp16"):
+            # Скалярное квантование: 1 или 2 байта на компоненту вместо 4
+            quantizer_type = (faiss.ScalarQuantizer.QT_8bit if self.index_type == "sq8"
+                              else faiss.ScalarQuantizer.QT_fp16)
+            index = faiss.IndexScalarQuantizer(d, quantizer_type, faiss.METRIC_INNER_PRODUCT)
+            train_size = min(n, cfg.FAISS_TRAIN_SAMPLE_SIZE)
+            train_ids = np.random.default_rng(42).choice(n, size=train_size, replace=False)
+            index.train(embeddings[np.sort(train_ids)])
+            return index
+
+        # Для IVF число кластеров не может превышать число векторов
+        nlist = max(1, min(cfg.FAISS_IVF_NLIST, n // 39 or 1))
+        quantizer = faiss.IndexFlatIP(d)
+        if self.index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            pq_m = cfg.FAISS_PQ_M
+            if d % pq_m != 0:
+                raise ValueError(f"FAISS_PQ_M={pq_m} must divide embedding dimension {d}.")
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, cfg.FAISS_PQ_NBITS,
+                                     faiss.METRIC_INNER_PRODUCT)
+
+        train_size = min(n, cfg.FAISS_TRAIN_SAMPLE_SIZE)
+        rng = np.random.default_rng(42)
+        train_ids = rng.choice(n, size=train_size, replace=False)
+        print(f"Training {self.index_type} index on {train_size} vectors (nlist={nlist})...")
+        index.train(embeddings[np.sort(train_ids)])
+        return index
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """
+        Задает параметры поиска для приближенных индексов:
+        nprobe для IVF и efSearch для HNSW.
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        self._invalidate_result_cache()
+        if self.index is None:
+            return
+
+        try:
+            ivf_index = faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            ivf_index = None
+        if ivf_index is not None:
+            ivf_index.nprobe = self.nprobe
+
+        hnsw_index = faiss.downcast_index(self.index)
+        if hasattr(hnsw_index, "hnsw"):
+            hnsw_index.hnsw.efSearch = self.ef_search
+
+    def evaluate_recall(self, k: int = 10, n_queries: int = 1000) -> float:
+        """
+        Оценивает recall@k текущего индекса (с переранжированием, если
+        оно включено) относительно точного поиска (IndexFlatIP) на
+        случайной выборке векторов документов.
+        """
+        if self.index is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+        if not os.path.exists(self.embedding_path):
+            raise FileNotFoundError(f"Embeddings not found at {self.embedding_path}.")
+
+        embeddings = np.load(self.embedding_path, mmap_mode="r").astype(np.float32)
+        faiss.normalize_L2(embeddings)
+        embeddings = np.vstack([embeddings, self._delta_embeddings()])
+
+        rng = np.random.default_rng(42)
+        query_ids = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+        queries = embeddings[query_ids]
+
+        flat_index = faiss.IndexFlatIP(embeddings.shape[1])
+        flat_index.add(embeddings)
+        # Эталон тоже без удаленных документов, как и результаты _search_index
+        flat_params, _ = self._get_search_params()
+        if flat_params is not None:
+            selector = flat_params.sel
+            flat_params = faiss.SearchParameters()
+            flat_params.sel = selector
+        _, true_indices = flat_index.search(queries, k, params=flat_params)
+
+        start_time = time.time()
+        _, ann_indices = self._search_index(queries, k)
+        elapsed = time.time() - start_time
+        ann_indices = ann_indices[:, :k]
+
+        hits = sum(
+            len(np.intersect1d(true_row, ann_row[ann_row != -1]))
+            for true_row, ann_row in zip(true_indices, ann_indices)
+        )
+        recall = hits / float(true_indices.size)
+        print(f"Recall@{k} ({self.index_type}) vs flat: {recall:.4f} "
+              f"on {len(queries)} queries, search took {elapsed:.4f} seconds.")
+        return recall
+
+    def _encode_uncached(self, queries_with_prefix: List[str]) -> np.ndarray:
+        """Кодирует запросы за один проход модели и нормализует векторы."""
+        query_embeddings = self.model.encode(
+            queries_with_prefix,
+            batch_size=DEFAULT_BATCH_SIZE,
+            convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+        faiss.normalize_L2(query_embeddings)
+        return query_embeddings
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Возвращает нормированные эмбеддинги запросов. Повторные запросы
+        берутся из LRU-кеша, остальные кодируются одним батчем.
+        """
+        query_embeddings = [self.query_cache.get((self.model_name, query)) for query in queries]
+        missing = {}
+        for i, (query, embedding) in enumerate(zip(queries, query_embeddings)):
+            if embedding is None:
+                missing.setdefault(query, []).append(i)
+
+        if missing:
+            missing_queries = list(missing)
+            with stage_timer("embeddings", "encode", items=len(missing_queries)):
+                encoded = self._encode_uncached([QUERY_PREFIX + query for query in missing_queries])
+            for query, embedding in zip(missing_queries, encoded):
+                self.query_cache.put((self.model_name, query), embedding)
+                for i in missing[query]:
+                    query_embeddings[i] = embedding
+
+        return np.vstack(query_embeddings)
+
+    def _get_search_params(self) -> Tuple[Optional["faiss.SearchParameters"],
+                                          Optional["faiss.SearchParameters"]]:
+        """
+        Параметры поиска для базового индекса и индекса дельты, которые
+        исключают удаленные документы прямо в FAISS (IDSelectorNot над
+        IDSelectorBatch), поэтому стоимость запроса не растет с числом
+        tombstone. Параметры запроса заменяют настройки индекса, поэтому
+        nprobe и efSearch переносятся в них явно.
+        """
+        if not self.deleted_ids:
+            return None, None
+        if self._search_params is None:
+            deleted_ids = np.fromiter(self.deleted_ids, dtype=np.int64, count=len(self.deleted_ids))
+            batch_selector = faiss.IDSelectorBatch(deleted_ids)
+            not_selector = faiss.IDSelectorNot(batch_selector)
+            if self.index_type == "hnsw":
+                params = faiss.SearchParametersHNSW()
+                params.efSearch = self.ef_search
+            elif self.index_type in ("ivf_flat", "ivf_pq"):
+                params = faiss.SearchParametersIVF()
+                params.nprobe = self.nprobe
+            else:
+                params = faiss.SearchParameters()
+            params.sel = not_selector
+            # Индекс дельты хранит сквозные id, поэтому селектор общий
+            delta_params = faiss.SearchParameters()
+            delta_params.sel = not_selector
+            # SWIG не держит ссылки на селекторы, их нужно хранить самим
+            self._deleted_selector = (batch_selector, not_selector)
+            self._search_params = (params, delta_params)
+        return self._search_params
+
+    def _search_index(self, query_embeddings: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ищет в базовом индексе и индексе дельты, пропуская удаленные
+        документы селектором, и сливает два top-k списка по скору.
+        При rerank_candidates кандидаты переранжируются по точным векторам.
+        """
+        num_vectors = self._num_vectors()
+        k = min(top_n, num_vectors)
+        if self.rerank_candidates:
+            k = min(max(k, self.rerank_candidates), num_vectors)
+        base_params, delta_params = self._get_search_params()
+        with stage_timer("embeddings", "index_search", items=len(query_embeddings)):
+            distances, indices = self.index.search(query_embeddings, k, params=base_params)
+            if self.delta_index.ntotal:
+                delta_distances, delta_indices = self.delta_index.search(
+                    query_embeddings, min(k, self.delta_index.ntotal), params=delta_params
+                )
+                distances, indices = self._merge_results(
+                    np.hstack([distances, delta_distances]), np.hstack([indices, delta_indices]), k
+                )
+        if self.rerank_candidates:
+            with stage_timer("embeddings", "rerank", items=len(query_embeddings)):
+                return self._rerank(query_embeddings, indices)
+        return distances, indices
+
+    @staticmethod
+    def _merge_results(distances: np.ndarray, indices: np.ndarray,
+                       k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Оставляет k лучших по скалярному произведению кандидатов каждой строки."""
+        distances = np.where(indices == -1, -np.inf, distances).astype(np.float32, copy=False)
+        order = np.argsort(-distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _reset_rerank_vectors(self):
+        """Сбрасывает отображение embeddings.npy и векторы дельты после перестроения."""
+        self._rerank_base = None
+        self._rerank_delta = None
+
+    def _get_rerank_vectors(self, doc_ids: np.ndarray) -> np.ndarray:
+        """
+        Читает нормированные векторы документов: базовые — из embeddings.npy
+        через memory map (только нужные строки), добавленные — из дельты.
+        """
+        if self._rerank_base is None:
+            if not os.path.exists(self.embedding_path):
+                raise FileNotFoundError(
+                    f"Embeddings not found at {self.embedding_path}; they are required for re-ranking."
+                )
+            self._rerank_base = np.load(self.embedding_path, mmap_mode="r")
+        if self._rerank_delta is None:
+            self._rerank_delta = self._delta_embeddings()
+
+        vectors = np.empty((len(doc_ids), self.index.d), dtype=np.float32)
+        is_base = doc_ids < self.base_size
+        base_ids = doc_ids[is_base]
+        # Чтение отсортированных строк из memory map идет последовательнее
+        unique_ids, inverse = np.unique(base_ids, return_inverse=True)
+        vectors[is_base] = self._rerank_base[unique_ids][inverse]
+        vectors[~is_base] = self._rerank_delta[doc_ids[~is_base] - self.base_size]
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _rerank(self, query_embeddings: np.ndarray,
+                indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Пересчитывает скоры кандидатов точным скалярным произведением и сортирует их."""
+        valid = indices != -1
+        vectors = self._get_rerank_vectors(indices[valid])
+        query_rows = np.nonzero(valid)[0]
+
+        distances = np.full(indices.shape, -np.inf, dtype=np.float32)
+        distances[valid] = np.einsum("ij,ij->i", vectors, query_embeddings[query_rows])
+        order = np.argsort(-distances, axis=1, kind="stable")
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def storage_report(self) -> dict:
+        """Размер индекса FAISS и файла эмбеддингов на диске (байты и байты на вектор)."""
+        if self.index is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+        index_bytes = os.path.getsize(self.faiss_index_path)
+        embeddings_bytes, storage_dtype = 0, None
+        if os.path.exists(self.embedding_path):
+            embeddings_bytes = os.path.getsize(self.embedding_path)
+            # Фактический тип файла, а не настройка движка: файл мог быть записан другим запуском
+            storage_dtype = str(np.load(self.embedding_path, mmap_mode="r").dtype)
+        report = {
+            "index_type": self.index_type,
+            "storage_dtype": storage_dtype,
+            "num_vectors": self._num_vectors(),
+            "index_bytes": index_bytes,
+            "embeddings_bytes": embeddings_bytes,
+            "index_bytes_per_vector": index_bytes / max(self.base_size, 1),
+        }
+        print(f"FAISS index ({self.index_type}): {index_bytes / 2**20:.1f} MB, "
+              f"embeddings ({storage_dtype}): {embeddings_bytes / 2**20:.1f} MB.")
+        return report
+
+    def _collect_results(self, distances: np.ndarray, indices: np.ndarray,
+                         top_n: int) -> List[List[Tuple[int, str, float]]]:
+        """Преобразует матрицы FAISS в списки (индекс, текст, скор) по каждому запросу."""
+        batch_results = []
+        with stage_timer("embeddings", "materialize", items=len(indices)):
+            for row_distances, row_indices in zip(distances, indices):
+                results = []
+                for doc_index, similarity_score in zip(row_indices, row_distances):
+                    if doc_index != -1 and doc_index not in self.deleted_ids:
+                        doc_text = self.original_texts[doc_index]
+                        results.append((doc_index, doc_text, round(similarity_score, 4)))
+                        if len(results) == top_n:
+                            break
+                batch_results.append(results)
+        return batch_results
+
+    def search(self, query: str, top_n: int = 5) -> List[Tuple[int, str, float]]:
+        """
+        Выполняет семантический поиск с использованием FAISS.
+        """
+        if self.index is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+
+        cached_results = self.result_cache.get((query, top_n))
+        if cached_results is not None:
+            return list(cached_results)
+
+        query_embedding = self._encode_queries([query])
+
+        distances, indices = self._search_index(query_embedding, top_n)
+
+        results = self._collect_results(distances, indices, top_n)[0]
+        self.result_cache.put((query, top_n), results)
+        return list(results)
+
+    def search_batch(self, queries: List[str], top_n: int = 5) -> List[List[Tuple[int, str, float]]]:
+        """
+        Выполняет семантический поиск сразу для батча запросов.
+        Все запросы кодируются одним вызовом модели, а поиск в FAISS
+        выполняется одной матрицей запросов.
+        """
+        if self.index is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+        if len(queries) == 0:
+            return []
+
+        batch_results = [self.result_cache.get((query, top_n)) for query in queries]
+        missing = [i for i, results in enumerate(batch_results) if results is None]
+        if not missing:
+            return [list(results) for results in batch_results]
+
+        query_embeddings = self._encode_queries([queries[i] for i in missing])
+
+        distances, indices = self._search_index(query_embeddings, top_n)
+
+        for i, results in zip(missing, self._collect_results(distances, indices, top_n)):
+            self.result_cache.put((queries[i], top_n), results)
+            batch_results[i] = results
+        return [list(results) for results in batch_results]
@@ -0,0 +1,79 @@
+from typing import Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+
+
+class ArrowTextStore(Sequence):
+    """
+    Ленивое хранилище текстов документов поверх memory-mapped Arrow IPC файла.
+    Тексты не копируются в Python-объекты при загрузке: строка
+    материализуется только при обращении к ней, а сами данные разделяются
+    между процессами через page cache.
+    """
+
+    COLUMN_NAME = "text"
+
+    def __init__(self, column: pa.ChunkedArray = None):
+        self._column = column
+        self._base_size = len(column) if column is not None else 0
+        self._extra_texts: List[str] = []
+
+    @classmethod
+    def write(cls, path: str, texts: Iterable[str]):
+        """Сохраняет тексты в несжатый Arrow IPC файл."""
+        array = pa.array([str(text) for text in texts], type=pa.large_string())
+        table = pa.Table.from_arrays([array], names=[cls.COLUMN_NAME])
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    @classmethod
+    def open(cls, path: str) -> "ArrowTextStore":
+        """Открывает файл через memory map без чтения текстов в память."""
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        return cls(table.column(cls.COLUMN_NAME))
+
+    @staticmethod
+    def encode_offsets(texts: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Кодирует тексты в пару массивов для .npy/.npz: смещения (int64,
+        n + 1 значений) и UTF-8 байты всех текстов подряд. В отличие от
+        np.array(texts, dtype=str) размер не зависит от самого длинного текста.
+        """
+        array = pa.array([str(text) for text in texts], type=pa.large_string())
+        offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[:len(array) + 1]
+        data_buffer = array.buffers()[2]
+        if data_buffer is None:
+            return offsets, np.empty(0, dtype=np.uint8)
+        return offsets, np.frombuffer(data_buffer, dtype=np.uint8)[:offsets[-1]]
+
+    @staticmethod
+    def decode_offsets(offsets: np.ndarray, data: np.ndarray) -> List[str]:
+        """Восстанавливает тексты, закодированные encode_offsets."""
+        array = pa.LargeStringArray.from_buffers(
+            len(offsets) - 1,
+            pa.py_buffer(np.ascontiguousarray(offsets, dtype=np.int64)),
+            pa.py_buffer(np.ascontiguousarray(data, dtype=np.uint8)),
+        )
+        return array.to_pylist()
+
+    def __len__(self) -> int:
+        return self._base_size + len(self._extra_texts)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("text index out of range")
+        if index < self._base_size:
+            return self._column[index].as_py()
+        return self._extra_texts[index - self._base_size]
+
+    def extend(self, texts: Iterable[str]):
+        """Добавляет тексты новых документов (хранятся в памяти)."""
+        self._extra_texts.extend(texts)
@@ -0,0 +1,154 @@
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config as cfg
+from src.instrumentation import stage_timer
+from src.search_tf_idf.search import TfidfSearch
+from src.search_embeddings.engine import EmbeddingSearchEngine
+
+SUPPORTED_FUSIONS = ("rrf", "blend")
+
+class HybridSearchEngine:
+    """
+    Гибридный поиск: TF-IDF и FRIDA+FAISS запускаются параллельно,
+    а их результаты сливаются через reciprocal rank fusion или
+    смешивание нормированных скоров.
+    """
+
+    def __init__(self,
+                 tfidf_engine: TfidfSearch,
+                 embedding_engine: EmbeddingSearchEngine,
+                 preprocessor_func,
+                 fusion: str = cfg.HYBRID_FUSION,
+                 rrf_k: int = cfg.HYBRID_RRF_K,
+                 alpha: float = cfg.HYBRID_ALPHA,
+                 candidate_multiplier: int = cfg.HYBRID_CANDIDATE_MULTIPLIER,
+                 short_circuit_score: Optional[float] = cfg.HYBRID_SHORT_CIRCUIT_SCORE):
+        """
+        Args:
+            tfidf_engine: Построенный TfidfSearch.
+            embedding_engine: Построенный EmbeddingSearchEngine по тому же корпусу.
+            preprocessor_func: Функция предобработки запроса для TF-IDF.
+            fusion: "rrf" или "blend".
+            rrf_k: Константа сглаживания в RRF.
+            alpha: Вес семантического поиска при "blend".
+            candidate_multiplier: Во сколько раз больше top_n кандидатов брать из каждого движка.
+            short_circuit_score: Если лучший TF-IDF скор не ниже порога,
+                возвращать лексические результаты без кодирования запроса
+                (их скоры приводятся к шкале слияния двух списков).
+        """
+        if fusion not in SUPPORTED_FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}'. Expected one of {SUPPORTED_FUSIONS}.")
+        self.tfidf_engine = tfidf_engine
+        self.embedding_engine = embedding_engine
+        self.preprocessor_func = preprocessor_func
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.alpha = alpha
+        self.candidate_multiplier = candidate_multiplier
+        self.short_circuit_score = short_circuit_score
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid-search")
+
+    def close(self):
+        """Останавливает пул потоков."""
+        self.executor.shutdown(wait=True)
+
+    def _is_confident(self, tfidf_results: List[Tuple[int, str, float]]) -> bool:
+        """Проверяет, достаточно ли лексического совпадения, чтобы не считать эмбеддинги."""
+        return (
+            self.short_circuit_score is not None
+            and len(tfidf_results) > 0
+            and tfidf_results[0][2] >= self.short_circuit_score
+        )
+
+    def _fuse(self, tfidf_results: List[Tuple[int, str, float]],
+              embedding_results: Optional[List[Tuple[int, str, float]]],
+              top_n: int) -> List[Tuple[int, str, float]]:
+        """
+        Сливает два ранжированных списка в один. embedding_results=None
+        означает, что семантический поиск пропущен (short circuit): тогда
+        TF-IDF получает полный вес, и скоры остаются в шкале слияния двух
+        списков (blend — до 1.0, RRF — до 2 / (rrf_k + 1)).
+        """
+        fused_scores: Dict[int, float] = {}
+        texts: Dict[int, str] = {}
+        # TF-IDF добирает до top_n документы с нулевым скором, в слиянии они не нужны
+        tfidf_results = [result for result in tfidf_results if result[2] > 0]
+
+        if self.fusion == "rrf":
+            if embedding_results is None:
+                weighted_results = ((tfidf_results, 2.0),)
+            else:
+                weighted_results = ((tfidf_results, 1.0), (embedding_results, 1.0))
+            for results, weight in weighted_results:
+                for rank, (doc_id, doc_text, _) in enumerate(results, 1):
+                    fused_scores[doc_id] = fused_scores.get(doc_id, 0.0) + weight / (self.rrf_k + rank)
+                    texts.setdefault(doc_id, doc_text)
+        else:
+            if embedding_results is None:
+                weighted_results = ((tfidf_results, 1.0),)
+            else:
+                weighted_results = ((tfidf_results, 1.0 - self.alpha), (embedding_results, self.alpha))
+            for results, weight in weighted_results:
+                if not results:
+                    continue
+                scores = [score for _, _, score in results]
+                low, high = min(scores), max(scores)
+                spread = high - low
+                for doc_id, doc_text, score in results:
+                    normalized = (score - low) / spread if spread > 0 else 1.0
+                    fused_scores[doc_id] = fused_scores.get(doc_id, 0.0) + weight * normalized
+                    texts.setdefault(doc_id, doc_text)
+
+        ranked = sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        return [(doc_id, texts[doc_id], round(float(score), 4)) for doc_id, score in ranked]
+
+    def search(self, query: str, top_n: int = cfg.TOP_N_SEARCH) -> List[Tuple[int, str, float]]:
+        """
+        Выполняет гибридный поиск.
+
+        Returns:
+            List[Tuple[int, str, float]]: Список кортежей (индекс, текст, скор слияния).
+        """
+        return self.search_batch([query], top_n=top_n)[0]
+
+    def search_batch(self, queries: List[str],
+                     top_n: int = cfg.TOP_N_SEARCH) -> List[List[Tuple[int, str, float]]]:
+        """
+        Выполняет гибридный поиск для батча запросов. Оба движка
+        обрабатывают батч целиком и работают одновременно.
+        """
+        if len(queries) == 0:
+            return []
+        candidate_k = top_n * self.candidate_multiplier
+
+        if self.short_circuit_score is None:
+            tfidf_future = self.executor.submit(
+                self.tfidf_engine.search_batch, queries, self.preprocessor_func,
+                top_n=candidate_k, return_scores=True
+            )
+            embedding_future = self.executor.submit(
+                self.embedding_engine.search_batch, queries, top_n=candidate_k
+            )
+            tfidf_batch, embedding_batch = tfidf_future.result(), embedding_future.result()
+        else:
+            # Сначала дешевый TF-IDF; эмбеддинги считаются только для неуверенных запросов
+            tfidf_batch = self.tfidf_engine.search_batch(
+                queries, self.preprocessor_func, top_n=candidate_k, return_scores=True
+            )
+            uncertain = [i for i, results in enumerate(tfidf_batch) if not self._is_confident(results)]
+            embedding_batch = [None] * len(queries)
+            if uncertain:
+                uncertain_results = self.embedding_engine.search_batch(
+                    [queries[i] for i in uncertain], top_n=candidate_k
+                )
+                for i, results in zip(uncertain, uncertain_results):
+                    embedding_batch[i] = results
+
+        batch_results = []
+        with stage_timer("hybrid", "fusion", items=len(queries)):
+            # Уверенные запросы тоже проходят через слияние (без списка
+            # эмбеддингов), чтобы скоры во всем ответе были в одной шкале
+            for tfidf_results, embedding_results in zip(tfidf_batch, embedding_batch):
+                batch_results.append(self._fuse(tfidf_results, embedding_results, top_n))
+        return batch_results
@@ -0,0 +1,122 @@
+import time
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from src import config as cfg
+from src.instrumentation import observe_stage
+
+SearchBatchFunc = Callable[[List[str], int], List[list]]
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы в микро-батчи.
+
+    Запросы копятся в очереди, пока батч не наберет max_batch_size
+    или пока с момента первого запроса не пройдет max_wait_ms. Затем
+    весь батч уходит одним вызовом search_batch_func в отдельный
+    executor, поэтому кодирование и поиск FAISS не блокируют event loop.
+    """
+
+    def __init__(self, search_batch_func: SearchBatchFunc, executor: Executor,
+                 max_batch_size: int = cfg.SERVICE_MAX_BATCH_SIZE,
+                 max_wait_ms: float = cfg.SERVICE_MAX_WAIT_MS,
+                 latency_window: int = 10_000):
+        self.search_batch_func = search_batch_func
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+        self.batch_sizes: Counter = Counter()
+        self.latencies: deque = deque(maxlen=latency_window)
+        self.total_queries = 0
+        self.total_batches = 0
+        self.total_errors = 0
+
+    def start(self):
+        """Запускает фоновую задачу, формирующую батчи."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def search(self, query: str, top_n: int) -> list:
+        """Ставит запрос в очередь и ждет его результат из батча."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_n, future, time.perf_counter()))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple]:
+        """Ждет первый запрос и добирает батч до размера или таймаута."""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            queries = [query for query, _, _, _ in batch]
+            # Батч ищется с наибольшим top_n, каждому запросу отдается его срез
+            max_top_n = max(top_n for _, top_n, _, _ in batch)
+
+            self.total_batches += 1
+            self.batch_sizes[len(batch)] += 1
+            started_at = time.perf_counter()
+            try:
+                batch_results = await loop.run_in_executor(
+                    self.executor, self.search_batch_func, queries, max_top_n
+                )
+            except Exception as e:
+                self.total_errors += len(batch)
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            observe_stage("service", "search_batch", finished_at - started_at, items=len(batch))
+            for (_, top_n, future, enqueued_at), results in zip(batch, batch_results):
+                self.total_queries += 1
+                self.latencies.append(finished_at - enqueued_at)
+                observe_stage("service", "request", finished_at - enqueued_at)
+                if not future.done():
+                    future.set_result(results[:top_n])
+
+    def stats(self) -> Dict[str, object]:
+        """Латентность (по последним запросам) и распределение размеров батчей."""
+        latencies_ms = np.array(self.latencies, dtype=np.float64) * 1000.0
+        if len(latencies_ms):
+            p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = 0.0
+        return {
+            "total_queries": self.total_queries,
+            "total_batches": self.total_batches,
+            "total_errors": self.total_errors,
+            "queue_size": self._queue.qsize(),
+            "mean_batch_size": self.total_queries / self.total_batches if self.total_batches else 0.0,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "latency_ms": {"p50": float(p50), "p95": float(p95), "p99": float(p99)},
+        }
@@ -0,0 +1,160 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from src import config as cfg
+from src.instrumentation import setup_instrumentation
+from .batcher import MicroBatcher, SearchBatchFunc
+
+BATCHERS_KEY = web.AppKey("batchers", dict)
+EXECUTORS_KEY = web.AppKey("executors", list)
+
+
+def _format_results(results: list) -> List[Dict[str, object]]:
+    """Преобразует кортежи движков (индекс, текст[, скор]) в JSON-совместимые словари."""
+    formatted = []
+    for result in results:
+        item = {"id": int(result[0]), "text": str(result[1])}
+        if len(result) > 2:
+            item["score"] = round(float(result[2]), 4)
+        formatted.append(item)
+    return formatted
+
+
+async def handle_search(request: web.Request) -> web.Response:
+    """GET /search?q=...&top_n=5&engine=... или POST /search с JSON {query, top_n, engine}."""
+    if request.method == "POST":
+        try:
+            params = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Request body must be JSON.")
+        if not isinstance(params, dict):
+            raise web.HTTPBadRequest(text="Request body must be a JSON object.")
+        query = params.get("query")
+    else:
+        params = request.query
+        query = params.get("q")
+
+    if not query or not str(query).strip():
+        raise web.HTTPBadRequest(text="Query must not be empty.")
+    try:
+        top_n = int(params.get("top_n", cfg.TOP_N_SEARCH))
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text="top_n must be an integer.")
+    if not 1 <= top_n <= cfg.SERVICE_MAX_TOP_N:
+        raise web.HTTPBadRequest(text=f"top_n must be between 1 and {cfg.SERVICE_MAX_TOP_N}.")
+
+    batchers = request.app[BATCHERS_KEY]
+    engine = params.get("engine", next(iter(batchers)))
+    if engine not in batchers:
+        raise web.HTTPBadRequest(text=f"Unknown engine '{engine}'. Expected one of {tuple(batchers)}.")
+
+    results = await batchers[engine].search(str(query), top_n)
+    return web.json_response({"query": query, "engine": engine, "results": _format_results(results)})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """GET /metrics: латентность и размеры батчей по каждому движку."""
+    return web.json_response({name: batcher.stats() for name, batcher in request.app[BATCHERS_KEY].items()})
+
+
+async def handle_prometheus_metrics(request: web.Request) -> web.Response:
+    """GET /metrics/prometheus: гистограммы этапов и счетчики в формате Prometheus."""
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "engines": list(request.app[BATCHERS_KEY])})
+
+
+def create_app(engines: Dict[str, SearchBatchFunc],
+               max_batch_size: int = cfg.SERVICE_MAX_BATCH_SIZE,
+               max_wait_ms: float = cfg.SERVICE_MAX_WAIT_MS) -> web.Application:
+    """
+    Создает aiohttp-приложение поиска.
+
+    Args:
+        engines: Имя движка -> функция (queries, top_n) -> результаты батча.
+            Первый движок используется по умолчанию.
+        max_batch_size: Максимальный размер микро-батча.
+        max_wait_ms: Сколько ждать добора батча после первого запроса.
+    """
+    if not engines:
+        raise ValueError("At least one search engine is required.")
+
+    app = web.Application()
+    # Все движки работают в одном рабочем потоке: эмбеддинговый и гибридный
+    # поиск делят одну модель, индекс FAISS и кеши, поэтому они вызываются
+    # строго последовательно, а event loop только принимает запросы
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+    app[EXECUTORS_KEY] = [executor]
+    app[BATCHERS_KEY] = {
+        name: MicroBatcher(search_batch_func, executor, max_batch_size, max_wait_ms)
+        for name, search_batch_func in engines.items()
+    }
+
+    async def on_startup(app: web.Application):
+        for batcher in app[BATCHERS_KEY].values():
+            batcher.start()
+
+    async def on_cleanup(app: web.Application):
+        for batcher in app[BATCHERS_KEY].values():
+            await batcher.stop()
+        for executor in app[EXECUTORS_KEY]:
+            executor.shutdown(wait=True)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get("/search", handle_search)
+    app.router.add_post("/search", handle_search)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/metrics/prometheus", handle_prometheus_metrics)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+def build_engines(tfidf_index_path: str = None) -> Dict[str, SearchBatchFunc]:
+    """
+    Загружает сохраненный FAISS индекс и, если указан путь, TF-IDF индекс
+    (TfidfSearch.save); при наличии обоих добавляет гибридный поиск.
+    """
+    from src.search_embeddings.engine import EmbeddingSearchEngine
+
+    embedding_engine = EmbeddingSearchEngine()
+    embedding_engine.load_index()
+    engines: Dict[str, SearchBatchFunc] = {"embeddings": embedding_engine.search_batch}
+
+    if tfidf_index_path:
+        from src.search_tf_idf.search import TfidfSearch
+        from src.search_hybrid.engine import HybridSearchEngine
+        from src.classic_keywords.preprocessing import preprocess_text
+
+        tfidf_engine = TfidfSearch.load(tfidf_index_path)
+        # MicroBatcher передает top_n вторым позиционным аргументом
+        engines["tfidf"] = lambda queries, top_n: tfidf_engine.search_batch(
+            queries, preprocess_text, top_n=top_n, return_scores=True
+        )
+        hybrid_engine = HybridSearchEngine(tfidf_engine, embedding_engine, preprocess_text)
+        engines["hybrid"] = hybrid_engine.search_batch
+    return engines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP-сервис поиска с микро-батчингом запросов")
+    parser.add_argument("--host", default=cfg.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=cfg.SERVICE_PORT)
+    parser.add_argument("--tfidf-index", default=None,
+                        help="Директория TF-IDF индекса, сохраненного TfidfSearch.save()")
+    parser.add_argument("--max-batch-size", type=int, default=cfg.SERVICE_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=cfg.SERVICE_MAX_WAIT_MS)
+    parser.add_argument("--profile-output", default=cfg.PROFILER_OUTPUT,
+                        help="Файл для стеков семплирующего профайлера (collapsed stacks)")
+    args = parser.parse_args()
+
+    # Метрики отдаются через /metrics/prometheus, отдельный порт не нужен
+    setup_instrumentation(metrics_port=None, profiler_output=args.profile_output)
+    app = create_app(build_engines(args.tfidf_index), args.max_batch_size, args.max_wait_ms)
+    web.run_app(app, host=args.host, port=args.port)
@@ -0,0 +1,74 @@
+import sys
+import asyncio
+import argparse
+from typing import Dict, Sequence
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from src import config as cfg
+from .batcher import SearchBatchFunc
+from .server import build_engines, create_app
+
+DEFAULT_SMOKE_QUERIES = ("машинное обучение", "нейронные сети", "анализ текста")
+
+
+async def smoke_check(engines: Dict[str, SearchBatchFunc],
+                      queries: Sequence[str] = DEFAULT_SMOKE_QUERIES,
+                      top_n: int = 3) -> bool:
+    """
+    Поднимает приложение create_app в памяти и отправляет запросы
+    к каждому движку через GET и POST (одновременно, чтобы они попали
+    в один микро-батч), а также заведомо неверные запросы, которые
+    должны вернуть 400. Возвращает True, если все проверки пройдены.
+    """
+    all_passed = True
+
+    def report(name: str, passed: bool, details: str = ""):
+        nonlocal all_passed
+        all_passed &= passed
+        print(f"{'OK  ' if passed else 'FAIL'} {name}" + (f": {details}" if details else ""))
+
+    async with TestClient(TestServer(create_app(engines))) as client:
+        for engine in engines:
+            responses = await asyncio.gather(
+                *(client.get("/search", params={"q": query, "top_n": top_n, "engine": engine})
+                  for query in queries),
+                client.post("/search", json={"query": queries[0], "top_n": top_n, "engine": engine}),
+            )
+            statuses = [response.status for response in responses]
+            if any(status != 200 for status in statuses):
+                report(f"engine '{engine}'", False, f"statuses {statuses}: {await responses[0].text()}")
+                continue
+            bodies = [await response.json() for response in responses]
+            well_formed = all(
+                len(body["results"]) <= top_n
+                and all({"id", "text"} <= set(result) for result in body["results"])
+                for body in bodies
+            )
+            report(f"engine '{engine}'", well_formed,
+                   f"{sum(len(body['results']) for body in bodies)} results for {len(bodies)} requests")
+
+        bad_requests = {
+            "empty query": client.get("/search", params={"q": ""}),
+            "top_n out of range": client.get("/search", params={"q": queries[0],
+                                                                  "top_n": cfg.SERVICE_MAX_TOP_N + 1}),
+            "unknown engine": client.get("/search", params={"q": queries[0], "engine": "unknown"}),
+            "non-object JSON body": client.post("/search", json=[queries[0]]),
+        }
+        for name, request in bad_requests.items():
+            response = await request
+            report(name, response.status == 400, f"status {response.status}")
+
+        response = await client.get("/metrics/prometheus")
+        report("prometheus metrics", response.status == 200, f"status {response.status}")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Смоук-проверка HTTP-сервиса поиска по всем движкам")
+    parser.add_argument("--tfidf-index", default=None,
+                        help="Директория TF-IDF индекса, сохраненного TfidfSearch.save()")
+    parser.add_argument("queries", nargs="*", help="Запросы (по умолчанию несколько тестовых)")
+    args = parser.parse_args()
+    passed = asyncio.run(smoke_check(build_engines(args.tfidf_index), args.queries or DEFAULT_SMOKE_QUERIES))
+    sys.exit(0 if passed else 1)
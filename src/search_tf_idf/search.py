@@ -1,10 +1,18 @@
+import os
+import json
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 from typing import List, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import csr_matrix
 
 from src.config import TFIDF_NGRAM_RANGE, TOP_N_SEARCH
+from src.lazy_import import lazy_import
+from src.instrumentation import stage_timer
+
+# sklearn импортируется дольше секунды, поэтому загружается при создании индекса
+sklearn_text = lazy_import("sklearn.feature_extraction.text")
 
 class TfidfSearch:
     """
@@ -12,8 +20,10 @@ class TfidfSearch:
     Хранит в себе векторизатор, матрицу и оригинальные тексты.
     """
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(ngram_range=TFIDF_NGRAM_RANGE)
+        self.vectorizer = sklearn_text.TfidfVectorizer(ngram_range=TFIDF_NGRAM_RANGE)
         self.matrix = None
+        self.inverted_index = None
+        self.term_max_weights = None
         self.original_texts_df = None
 
     def build_index(self, lemmatized_texts: pd.Series, original_texts: pd.Series):
@@ -23,36 +33,255 @@ class TfidfSearch:
         """
         print("Building TF-IDF index...")
         self.matrix = self.vectorizer.fit_transform(lemmatized_texts)
+        self._build_inverted_index()
         self.original_texts_df = original_texts.reset_index(drop=True)
         print("TF-IDF index built successfully.")
 
-    def search(self, query: str, preprocessor_func, top_n: int = TOP_N_SEARCH) -> List[Tuple[int, str]]:
+    def _build_inverted_index(self):
+        """
+        Строит инвертированный индекс: строка i матрицы термин × документ —
+        это posting list термина i (id документов и их TF-IDF веса).
+        Строки TF-IDF матрицы уже L2-нормированы, поэтому скалярное
+        произведение с нормированным запросом равно косинусному сходству.
+        """
+        self.inverted_index = self.matrix.T.tocsr()
+        self.inverted_index.sort_indices()
+        self.term_max_weights = self.inverted_index.max(axis=1).toarray().ravel()
+
+    def save(self, path: str):
+        """
+        Сохраняет индекс в директорию в виде несжатых .npy массивов
+        (posting lists в CSR-формате, idf) и Arrow-файлов со словарем и текстами,
+        чтобы их можно было загрузить через memory map без повторного fit.
+        """
+        if self.matrix is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+
+        print(f"Saving TF-IDF index to {path}...")
+        os.makedirs(path, exist_ok=True)
+
+        arrays = {
+            "postings_data": self.inverted_index.data,
+            "postings_indices": self.inverted_index.indices,
+            "postings_indptr": self.inverted_index.indptr,
+            "term_max_weights": self.term_max_weights,
+            "idf": self.vectorizer.idf_,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+        # Словарь хранится как Arrow-колонка терминов в порядке их id.
+        # Он все равно целиком читается в dict, поэтому его можно сжать
+        vocabulary_table = pa.table({"term": pa.array(self.vectorizer.get_feature_names_out(),
+                                                      type=pa.large_string())})
+        feather.write_feather(vocabulary_table, os.path.join(path, "vocabulary.arrow"),
+                              compression="zstd")
+
+        texts_table = pa.table({"text": pa.array(self.original_texts_df.astype(str).tolist(),
+                                                 type=pa.large_string())})
+        feather.write_feather(texts_table, os.path.join(path, "texts.arrow"),
+                              compression="uncompressed")
+
+        meta = {
+            "ngram_range": list(self.vectorizer.ngram_range),
+            "shape": list(self.matrix.shape),
+        }
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        print("TF-IDF index saved successfully.")
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfSearch":
+        """
+        Загружает индекс, сохраненный методом save(). Массивы отображаются
+        в память, векторизатор восстанавливается без повторного fit.
+        """
+        print(f"Loading TF-IDF index from {path}...")
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        def load_array(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        search = cls()
+        search.vectorizer = sklearn_text.TfidfVectorizer(ngram_range=tuple(meta["ngram_range"]))
+
+        terms = feather.read_table(os.path.join(path, "vocabulary.arrow"),
+                                   memory_map=True).column("term").to_pylist()
+        search.vectorizer.vocabulary_ = dict(zip(terms, range(len(terms))))
+        search.vectorizer.idf_ = np.asarray(load_array("idf"))
+
+        n_docs, n_terms = meta["shape"]
+        search.inverted_index = csr_matrix(
+            (load_array("postings_data"), load_array("postings_indices"), load_array("postings_indptr")),
+            shape=(n_terms, n_docs),
+            copy=False,
+        )
+        search.inverted_index.has_sorted_indices = True
+        search.term_max_weights = load_array("term_max_weights")
+        # Матрица документ × термин — транспонированное представление без копирования
+        search.matrix = search.inverted_index.T
+
+        texts_table = feather.read_table(os.path.join(path, "texts.arrow"), memory_map=True)
+        search.original_texts_df = texts_table.column("text").to_pandas(types_mapper=pd.ArrowDtype)
+        print(f"TF-IDF index loaded. Contains {n_docs} documents and {n_terms} terms.")
+        return search
+
+    def _get_postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Возвращает posting list термина: id документов и веса."""
+        start, end = self.inverted_index.indptr[term_id], self.inverted_index.indptr[term_id + 1]
+        return self.inverted_index.indices[start:end], self.inverted_index.data[start:end]
+
+    def _score_query(self, term_ids: np.ndarray, term_weights: np.ndarray,
+                     top_n: int, early_termination: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Накапливает скоры только для документов, у которых есть общие
+        термины с запросом.
+
+        При early_termination используется стратегия в духе MaxScore:
+        термины обходятся по убыванию верхней границы вклада, и как только
+        суммарная граница оставшихся терминов становится меньше текущего
+        top_n-го скора, новые документы в кандидаты больше не добавляются.
+        Результат top_n при этом остается точным.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Отсортированные id кандидатов и их скоры.
+        """
+        if len(term_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        upper_bounds = term_weights * self.term_max_weights[term_ids]
+        order = np.argsort(-upper_bounds, kind="stable")
+        # remaining_bounds[j] — максимальный вклад терминов order[j:]
+        remaining_bounds = np.cumsum(upper_bounds[order][::-1])[::-1]
+
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        for j, position in enumerate(order):
+            doc_ids, weights = self._get_postings(term_ids[position])
+            contributions = weights * term_weights[position]
+
+            if early_termination and len(candidates) >= top_n:
+                threshold = np.partition(scores, -top_n)[-top_n]
+                if remaining_bounds[j] < threshold:
+                    # Непросмотренные документы уже не попадут в top_n:
+                    # обновляем только существующих кандидатов
+                    positions = np.searchsorted(candidates, doc_ids)
+                    mask = positions < len(candidates)
+                    mask[mask] = candidates[positions[mask]] == doc_ids[mask]
+                    scores[positions[mask]] += contributions[mask]
+                    continue
+
+            candidates, inverse = np.unique(
+                np.concatenate([candidates, doc_ids]), return_inverse=True
+            )
+            scores = np.bincount(
+                inverse, weights=np.concatenate([scores, contributions]), minlength=len(candidates)
+            )
+
+        return candidates, scores
+
+    def _top_n_from_candidates(self, candidates: np.ndarray, scores: np.ndarray,
+                               top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Выбирает top_n документов по скору. Если совпавших документов
+        меньше top_n, добирает документы с нулевым скором.
+        """
+        count = min(top_n, self.matrix.shape[0])
+        if len(candidates) > count:
+            top_positions = np.argpartition(scores, -count)[-count:]
+            candidates, scores = candidates[top_positions], scores[top_positions]
+        order = np.argsort(-scores, kind="stable")
+        top_indices, top_scores = candidates[order], scores[order]
+
+        if len(top_indices) < count:
+            pool_size = min(count + len(top_indices), self.matrix.shape[0])
+            padding = np.setdiff1d(np.arange(pool_size), top_indices)[:count - len(top_indices)]
+            top_indices = np.concatenate([top_indices, padding])
+            top_scores = np.concatenate([top_scores, np.zeros(len(padding))])
+        return top_indices, top_scores
+
+    def _format_results(self, top_indices: np.ndarray, top_scores: np.ndarray,
+                        return_scores: bool) -> List[Tuple]:
+        """Собирает кортежи (индекс, текст) или (индекс, текст, скор)."""
+        if return_scores:
+            return [
+                (idx, self.original_texts_df.iloc[idx], round(float(score), 4))
+                for idx, score in zip(top_indices, top_scores)
+            ]
+        return [(idx, self.original_texts_df.iloc[idx]) for idx in top_indices]
+
+    def search(self, query: str, preprocessor_func, top_n: int = TOP_N_SEARCH,
+               early_termination: bool = False, return_scores: bool = False) -> List[Tuple]:
         """
         Выполняет поиск по построенному индексу.
-        
+
         Args:
             query (str): Поисковый запрос.
             preprocessor_func: Функция для предобработки запроса.
             top_n (int): Количество лучших результатов для возврата.
-        
+            early_termination (bool): Отсекать документы, которые не могут
+                попасть в top_n (MaxScore).
+            return_scores (bool): Добавлять косинусное сходство в результаты.
+
         Returns:
-            List[Tuple[int, str]]: Список кортежей (индекс документа, текст документа).
+            List[Tuple]: Список кортежей (индекс документа, текст документа)
+                или (индекс, текст, скор) при return_scores=True.
         """
         if self.matrix is None:
             raise RuntimeError("Index has not been built. Call build_index() first.")
-        
-        processed_query = preprocessor_func(query)
-        query_vector = self.vectorizer.transform([processed_query])
-        
-        cosine_sim = cosine_similarity(query_vector, self.matrix).flatten()
-        
-        count = min(top_n, self.matrix.shape[0]) 
-        
-        top_indices = np.argpartition(cosine_sim, -count)[-count:]
-        sorted_top_indices = top_indices[np.argsort(cosine_sim[top_indices])][::-1]
-        
-        results = [
-            (idx, self.original_texts_df.iloc[idx]) for idx in sorted_top_indices
-        ]
-        
-        return results
\ No newline at end of file
+
+        with stage_timer("tfidf", "preprocess"):
+            processed_query = preprocessor_func(query)
+        with stage_timer("tfidf", "encode"):
+            query_vector = self.vectorizer.transform([processed_query])
+
+        with stage_timer("tfidf", "index_search"):
+            candidates, scores = self._score_query(
+                query_vector.indices, query_vector.data, top_n, early_termination
+            )
+            top_indices, top_scores = self._top_n_from_candidates(candidates, scores, top_n)
+
+        with stage_timer("tfidf", "materialize"):
+            return self._format_results(top_indices, top_scores, return_scores)
+
+    def search_batch(self, queries: List[str], preprocessor_func,
+                     top_n: int = TOP_N_SEARCH, return_scores: bool = False) -> List[List[Tuple]]:
+        """
+        Выполняет поиск сразу для батча запросов.
+
+        Все запросы векторизуются одной матрицей и умножаются на
+        инвертированный индекс одним разреженным произведением: в результат
+        попадают только документы, имеющие общие термины с запросом.
+
+        Args:
+            queries (List[str]): Список поисковых запросов.
+            preprocessor_func: Функция для предобработки запроса.
+            top_n (int): Количество лучших результатов для каждого запроса.
+            return_scores (bool): Добавлять косинусное сходство в результаты.
+
+        Returns:
+            List[List[Tuple]]: Результаты поиска для каждого запроса.
+        """
+        if self.matrix is None:
+            raise RuntimeError("Index has not been built. Call build_index() first.")
+        if len(queries) == 0:
+            return []
+
+        with stage_timer("tfidf", "preprocess", items=len(queries)):
+            processed_queries = [preprocessor_func(query) for query in queries]
+        with stage_timer("tfidf", "encode", items=len(queries)):
+            query_matrix = self.vectorizer.transform(processed_queries)
+
+        with stage_timer("tfidf", "index_search", items=len(queries)):
+            scores_matrix = (query_matrix @ self.inverted_index).tocsr()
+            top_candidates = []
+            for row in range(scores_matrix.shape[0]):
+                start, end = scores_matrix.indptr[row], scores_matrix.indptr[row + 1]
+                top_candidates.append(self._top_n_from_candidates(
+                    scores_matrix.indices[start:end], scores_matrix.data[start:end], top_n
+                ))
+
+        with stage_timer("tfidf", "materialize", items=len(queries)):
+            return [self._format_results(top_indices, top_scores, return_scores)
+                    for top_indices, top_scores in top_candidates]
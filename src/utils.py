@@ -1,12 +1,20 @@
+import os
 import pandas as pd
+from typing import Optional, Sequence
+from src.config import DATA_DIR
 
 
-def load_dataset(file_name: str = "df_cleaned"):
-    data_path = f'../data/{file_name}.parquet'
+def load_dataset(file_name: str = "df_cleaned", data_dir: str = DATA_DIR,
+                 columns: Optional[Sequence[str]] = None):
+    """
+    Загружает parquet-файл file_name из data_dir (по умолчанию cfg.DATA_DIR).
+    columns ограничивает чтение нужными колонками.
+    """
+    data_path = os.path.join(data_dir, f"{file_name}.parquet")
     try:
-        df = pd.read_parquet(data_path)
+        df = pd.read_parquet(data_path, columns=list(columns) if columns is not None else None)
         print(f"Данные успешно загружены из {data_path}. Количество записей: {len(df)}")
         return df
     except FileNotFoundError:
         print(f"Ошибка: Файл {data_path} не найден. Убедитесь, что вы запустили ноутбук с EDA и предобработкой.")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import aiohttp
+
+from src.llm_keywords.backends import BackendResponse, LLMBackend, LLMBackendError
+from src.llm_keywords.extracrt_keyphrases import RateLimiter, classify_error, extract_keyphrases_batch_async
+
+
+class FlakyBackend(LLMBackend):
+    """Бэкенд, который первые failures запросов обрывает разрывом соединения"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def generate(self, prompt, abstracts_batch):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise aiohttp.ServerDisconnectedError()
+        return BackendResponse(parsed={"annotation_1": ["ключевая фраза"]})
+
+
+class ClassifyErrorTest(unittest.TestCase):
+
+    def test_aiohttp_transport_errors_are_retryable(self):
+        self.assertEqual(classify_error(aiohttp.ServerDisconnectedError()), (False, True))
+        self.assertEqual(classify_error(aiohttp.ClientConnectionError()), (False, True))
+
+    def test_aiohttp_response_errors_are_not_transport_errors(self):
+        error = aiohttp.ClientResponseError(mock.Mock(real_url="http://localhost"), (), status=503)
+        self.assertEqual(classify_error(error), (False, False))
+
+    def test_status_codes(self):
+        self.assertEqual(classify_error(LLMBackendError(429)), (True, True))
+        self.assertEqual(classify_error(LLMBackendError(400)), (False, False))
+
+    def test_server_disconnect_is_retried(self):
+        backend = FlakyBackend(failures=1)
+        with mock.patch("asyncio.sleep", new=mock.AsyncMock()):
+            batch_idx, parsed = asyncio.run(extract_keyphrases_batch_async(
+                backend, ["аннотация"], start_idx=0, batch_idx=0,
+                rate_limiter=RateLimiter(max_requests_per_minute=6000, max_tokens_per_minute=None),
+            ))
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(parsed, {"annotation_1": ["ключевая фраза"]})
+
+
+if __name__ == "__main__":
+    unittest.main()